@@ -1,33 +1,104 @@
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema.output_parser import StrOutputParser
-from typing import List, Dict, Optional
+from langchain.schema.runnable import RunnableLambda
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+import asyncio
+import bisect
+import functools
+import heapq
+import itertools
+import operator
+import os
+import re
 import time
 import logging
+import jieba
 from .vector_store import VectorStoreManager
 from .model_factory import ModelFactory
+from .semantic_cache import semantic_answer_cache
+from .cache_manager import cache_manager, MemoCache
+
+# 可选依赖：Aho-Corasick多模式匹配，用于加速引用检测
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
-class DocumentAnalysisAgent:
-    """文档分析智能体 - 支持多种大模型"""
-    
-    def __init__(
-        self, 
-        vector_store_manager: VectorStoreManager,
-        llm_type: str = None,
-        model_config: dict = None
-    ):
-        self.vector_store = vector_store_manager
-        
-        # 使用模型工厂创建LLM
-        self.llm = ModelFactory.create_llm(
-            model_type=llm_type,
-            **(model_config or {})
-        )
-        
-        # 针对通义千问优化的中文提示词
-        if llm_type and llm_type.lower() == "qwen":
-            self.qa_prompt = ChatPromptTemplate.from_template("""
+# jieba分词函数的模块级别名（lcut直接返回列表）
+_jcut = jieba.lcut
+
+# 停用词（模块级不可变集合，所有请求共享）
+_STOPWORDS = frozenset({'的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一', '一个'})
+
+# 回答评分等CPU密集型工作（jieba分词）专用线程池，避免阻塞事件循环
+_CPU_POOL = ThreadPoolExecutor(
+    max_workers=min(8, os.cpu_count() or 4),
+    thread_name_prefix="agent-cpu"
+)
+
+# 有效问题的最短长度（去除首尾空白后）
+_MIN_QUESTION_LENGTH = 2
+
+# 自适应上下文：至少保留的片段数，以及累计相似度达到总和该比例时截断
+_MIN_CONTEXT_RESULTS = 2
+_CONTEXT_SCORE_COVERAGE = 0.85
+
+# 增强问答精确匹配缓存的最大条目数和有效期（与其他问答缓存一致）
+_EXACT_ANSWER_CACHE_MAXSIZE = 256
+_EXACT_ANSWER_CACHE_TTL = 3600
+
+# 判定为直接引用的最短公共片段长度
+_QUOTE_SHINGLE_LEN = 20
+
+# 要点识别：编号/列表前缀，以及要点关键词
+_KEY_POINT_PREFIX_RE = re.compile(r'(?:[123]\.|[一二三]、|•|-)')
+_KEY_POINT_KEYWORD_RE = re.compile(r'重要|关键|核心|主要|结论|发现')
+
+# 回答质量评估用到的文本特征（每类一次正则扫描）
+_SENTENCE_ENDING_RE = re.compile(r'[。！？.!?]')
+_LOGICAL_CONNECTOR_RE = re.compile(r'因为|所以|但是|然而|此外|另外|首先|其次|最后|总之')
+_UNCERTAINTY_PHRASE_RE = re.compile(r'可能|大概|据文档显示|根据资料|文档中提到')
+
+# 缺省的空元数据（只读共享，避免每次调用分配新字典）
+_EMPTY_METADATA: Dict = {}
+
+_SIMILARITY_KEY = operator.itemgetter("similarity_score")
+_CONTEXT_PARAGRAPH_FMT = "段落 {0} (相似度: {1:.3f}):\n{2}\n".format
+
+def _content_preview(content: str, limit: int = 200) -> str:
+    """截取内容预览"""
+    return content[:limit] + "..." if len(content) > limit else content
+
+@functools.lru_cache(maxsize=256)
+def _tokenize(text: str) -> frozenset:
+    """分词（关闭HMM）并移除停用词；同一请求内多次评估的问题和回答只分词一次"""
+    return frozenset(w for w in _jcut(text.lower(), HMM=False) if w not in _STOPWORDS)
+
+@functools.lru_cache(maxsize=8192)
+def _tokenize_chunk(chunk_id: str, content: str) -> frozenset:
+    """文档块分词，按chunk_id跨请求缓存（内容参与键比较，内容变化时自动失效）"""
+    return _tokenize.__wrapped__(content)
+
+@functools.lru_cache(maxsize=2048)
+def _chunk_key_point_lines(chunk_id: str, content: str) -> Tuple[str, ...]:
+    """文档块中符合要点模式的行（只与内容有关），按chunk_id跨请求缓存，正则扫描每个块只做一次"""
+    key_point_lines = []
+    for line in content.split('\n'):
+        line = line.strip()
+        # 识别要点模式
+        if (_KEY_POINT_PREFIX_RE.match(line) or
+            10 <= len(line) <= 200 and _KEY_POINT_KEYWORD_RE.search(line)):
+            key_point_lines.append(line)
+    return tuple(key_point_lines)
+
+# 提示词模板在导入时编译一次，所有智能体实例和请求共享
+# 针对通义千问优化的中文提示词
+_QA_PROMPT_QWEN = ChatPromptTemplate.from_template("""
 你是一个专业的中文文献分析助手，具备深厚的学术背景和文献理解能力。请基于提供的文档内容，准确、专业地回答用户的问题。
 
 文档相关内容：
@@ -45,8 +116,8 @@ class DocumentAnalysisAgent:
 
 回答：
 """)
-            
-            self.summary_prompt = ChatPromptTemplate.from_template("""
+
+_SUMMARY_PROMPT_QWEN = ChatPromptTemplate.from_template("""
 请为以下学术文档生成一份高质量的中文摘要：
 
 文档内容：
@@ -62,9 +133,9 @@ class DocumentAnalysisAgent:
 
 摘要：
 """)
-        else:
-            # 保持原有的通用提示词
-            self.qa_prompt = ChatPromptTemplate.from_template("""
+
+# 通用提示词
+_QA_PROMPT_GENERIC = ChatPromptTemplate.from_template("""
 你是一个专业的文档分析助手。基于以下文档内容，请准确回答用户的问题。
 
 文档相关内容：
@@ -81,8 +152,8 @@ class DocumentAnalysisAgent:
 
 回答：
 """)
-            
-            self.summary_prompt = ChatPromptTemplate.from_template("""
+
+_SUMMARY_PROMPT_GENERIC = ChatPromptTemplate.from_template("""
 请为以下文档内容生成一个简洁而全面的摘要：
 
 文档内容：
@@ -96,74 +167,249 @@ class DocumentAnalysisAgent:
 
 摘要：
 """)
+
+# 增强问答提示词
+_ENHANCED_QA_PROMPT = ChatPromptTemplate.from_template("""
+你是一个专业的中文文献分析助手，具备深厚的学术背景和文献理解能力。请基于提供的文档内容，准确、专业地回答用户的问题。
+
+【文档相关内容】
+{context}
+
+【用户问题】
+{question}
+
+【回答要求】
+1. 严格基于提供的文档内容进行回答，确保信息准确性
+2. 如果文档中缺少直接相关信息，请明确指出并尽可能提供相关背景
+3. 保持回答的学术性和客观性，使用准确的专业术语
+4. 适当引用原文关键段落或数据支持你的回答
+5. 回答要条理清晰，逻辑连贯，便于理解
+6. 如果问题涉及多个方面，请分点详细说明
+7. 回答长度要适中，既要全面又要简洁
+
+【专业回答】
+""")
+
+# 增强摘要提示词
+_ENHANCED_SUMMARY_PROMPT = ChatPromptTemplate.from_template("""
+请为以下学术文档生成一份高质量的中文摘要，要求结构清晰、内容准确、重点突出。
+
+【文档内容】
+{content}
+
+【摘要生成要求】
+1. 准确概括文档的核心观点、主要发现和重要结论
+2. 突出文档的学术价值和创新点
+3. 保持逻辑结构清晰，语言表达准确流畅
+4. 摘要长度控制在300-600字之间
+5. 使用规范的学术写作风格
+6. 如果涉及数据或实验结果，请准确提及
+7. 分段组织，便于阅读理解
+
+【结构化摘要】
+""")
+
+# 分段摘要提示词（map阶段：逐个片段提炼要点）
+_MAP_SUMMARY_PROMPT = ChatPromptTemplate.from_template("""
+请简要概括以下文档片段的要点，保留关键数据、方法和结论，控制在100-200字之间。
+
+【文档片段】
+{content}
+
+【片段要点】
+""")
+
+# 汇总摘要提示词（reduce阶段：综合各片段要点）
+_REDUCE_SUMMARY_PROMPT = ChatPromptTemplate.from_template("""
+以下是同一篇学术文档各片段的要点概括，请综合这些内容生成一份完整的中文摘要。
+
+【片段要点】
+{parts}
+
+【摘要生成要求】
+1. 准确概括文档的核心观点、主要发现和重要结论
+2. 合并重复信息，保持逻辑结构清晰
+3. 摘要长度控制在300-600字之间
+4. 使用规范的学术写作风格
+5. 分段组织，便于阅读理解
+
+【结构化摘要】
+""")
+
+# map阶段的最大并发LLM调用数
+_MAP_SUMMARY_CONCURRENCY = 5
+
+def _compile_prompt_formatter(prompt: ChatPromptTemplate) -> Callable[..., str]:
+    """将单条消息的聊天模板预绑定为str.format，结果与prompt.format(...)一致（含"Human: "角色前缀）"""
+    return ("Human: " + prompt.messages[0].prompt.template).format
+
+class DocumentAnalysisAgent:
+    """文档分析智能体 - 支持多种大模型"""
+    
+    def __init__(
+        self, 
+        vector_store_manager: VectorStoreManager,
+        llm_type: str = None,
+        model_config: dict = None
+    ):
+        self.vector_store = vector_store_manager
+        self.answer_cache = semantic_answer_cache
+        self.cache_manager = cache_manager
+        
+        # 增强问答精确匹配缓存（TTL LRU），应对刷新、重复点击等完全相同的请求
+        self._exact_answer_cache = MemoCache(maxsize=_EXACT_ANSWER_CACHE_MAXSIZE, ttl=_EXACT_ANSWER_CACHE_TTL)
+        
+        # 进行中的请求（请求键 -> asyncio任务），用于合并并发的相同请求
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        
+        # 使用模型工厂创建LLM
+        self.llm = ModelFactory.create_llm(
+            model_type=llm_type,
+            **(model_config or {})
+        )
+        
+        # 针对通义千问使用优化的中文提示词，否则使用通用提示词
+        if llm_type and llm_type.lower() == "qwen":
+            self.qa_prompt = _QA_PROMPT_QWEN
+            self.summary_prompt = _SUMMARY_PROMPT_QWEN
+        else:
+            self.qa_prompt = _QA_PROMPT_GENERIC
+            self.summary_prompt = _SUMMARY_PROMPT_GENERIC
+        
+        # 预先构建LCEL链，避免每次请求重复组装
+        self._qa_chain = self._build_chain(self.qa_prompt)
+        self._summary_chain = self._build_chain(self.summary_prompt)
+        self._enhanced_qa_chain = self._build_chain(_ENHANCED_QA_PROMPT)
+        self._enhanced_summary_chain = self._build_chain(_ENHANCED_SUMMARY_PROMPT)
+        self._map_summary_chain = self._build_chain(_MAP_SUMMARY_PROMPT)
+        self._reduce_summary_chain = self._build_chain(_REDUCE_SUMMARY_PROMPT)
+        
+        # 流式输出使用不带降级的链（降级链不支持逐token流式返回）
+        self._qa_stream_chain = self.qa_prompt | self.llm | StrOutputParser()
+        self._summary_stream_chain = self.summary_prompt | self.llm | StrOutputParser()
+        self._enhanced_qa_stream_chain = _ENHANCED_QA_PROMPT | self.llm | StrOutputParser()
+    
+    def _build_chain(self, prompt: ChatPromptTemplate):
+        """构建LCEL链，链式调用失败时降级为直接调用模型（兼容不同模型接口）"""
+        format_prompt = _compile_prompt_formatter(prompt)
+        direct_chain = RunnableLambda(lambda inputs: self._predict_directly(format_prompt(**inputs)))
+        return (prompt | self.llm | StrOutputParser()).with_fallbacks([direct_chain])
+    
+    def _predict_directly(self, prompt_text: str) -> str:
+        """使用已格式化的提示词直接调用模型"""
+        logger.warning("链式调用失败，使用直接调用")
+        return self.llm.predict(prompt_text)
     
     def answer_question(
         self, 
         document_id: str, 
         question: str, 
-        max_results: int = 5
+        max_results: int = 5,
+        no_cache: bool = False
     ) -> Dict:
-        """回答基于文档的问题"""
-        start_time = time.time()
+        """回答基于文档的问题（no_cache=True 时跳过语义缓存）"""
+        start_time = time.perf_counter()
+        
+        if self._is_degenerate_question(question):
+            return {
+                **self._degenerate_question_response(),
+                "processing_time": time.perf_counter() - start_time,
+                "cache_hit": False
+            }
         
         try:
-            # 1. 向量搜索相关内容
-            search_results = self.vector_store.search_similar_chunks(
-                document_id=document_id,
-                query=question,
-                k=max_results
-            )
+            # 1. 完全相同的问题直接返回缓存的回答
+            answer_key = self.cache_manager.answer_cache_key(document_id, question, max_results)
+            if not no_cache:
+                cached_answer = self.cache_manager.get(answer_key)
+                if cached_answer:
+                    logger.info(f"命中问答缓存: {document_id}")
+                    return {
+                        **cached_answer,
+                        "processing_time": time.perf_counter() - start_time,
+                        "cache_hit": True
+                    }
+            
+            # 2. 生成问题向量，同时用于语义缓存查找和向量搜索
+            query_embedding = self.vector_store.embeddings.embed_query(question)
+            
+            if not no_cache:
+                cached = self.answer_cache.get(document_id, query_embedding, max_results)
+                if cached:
+                    logger.info(f"命中语义问答缓存: {document_id}, 相似度: {cached['similarity']:.3f}")
+                    return {
+                        "answer": cached["answer"],
+                        "confidence": cached["confidence"],
+                        "sources": cached["sources"],
+                        "processing_time": time.perf_counter() - start_time,
+                        "success": True,
+                        "error": None,
+                        "cache_hit": True
+                    }
+            
+            # 3. 向量搜索相关内容（搜索结果与摘要等共享搜索缓存）
+            search_key = self.cache_manager.search_cache_key(document_id, question, max_results)
+            search_results = self.cache_manager.get(search_key)
+            if not search_results:
+                search_results = self.vector_store.search_similar_chunks(
+                    document_id=document_id,
+                    query=question,
+                    k=max_results,
+                    query_embedding=query_embedding
+                )
+                if search_results:
+                    self.cache_manager.set(search_key, search_results, expire=3600)
             
             if not search_results:
                 return {
                     "answer": "抱歉，在该文档中未找到与您问题相关的内容。",
                     "confidence": 0.0,
                     "sources": [],
-                    "processing_time": time.time() - start_time,
+                    "processing_time": time.perf_counter() - start_time,
                     "success": True
                 }
             
-            # 2. 构建上下文
+            # 4. 构建上下文
             context = self._build_context(search_results)
             
-            # 3. 生成回答 - 兼容不同模型接口
-            try:
-                # 尝试使用LangChain链式调用
-                chain = self.qa_prompt | self.llm | StrOutputParser()
-                answer = chain.invoke({
-                    "context": context,
-                    "question": question
-                })
-            except Exception as e:
-                # 降级到直接调用模型
-                logger.warning(f"链式调用失败，使用直接调用: {str(e)}")
-                prompt_text = self.qa_prompt.format(context=context, question=question)
-                answer = self.llm.predict(prompt_text)
-            
-            # 4. 计算置信度
+            # 5. 生成回答 - 兼容不同模型接口
+            answer = self._qa_chain.invoke({
+                "context": context,
+                "question": question
+            })
+            
+            # 6. 计算置信度
             confidence = self._calculate_confidence(search_results)
             
-            # 5. 准备源信息
+            # 7. 准备源信息
             sources = self._prepare_sources(search_results)
             
-            processing_time = time.time() - start_time
+            answer = answer.strip()
+            processing_time = time.perf_counter() - start_time
             
-            return {
-                "answer": answer.strip(),
+            result = {
+                "answer": answer,
                 "confidence": confidence,
                 "sources": sources,
                 "processing_time": processing_time,
                 "success": True,
-                "error": None
+                "error": None,
+                "cache_hit": False
             }
             
+            if not no_cache:
+                self.answer_cache.put(document_id, query_embedding, answer, sources, confidence, max_results)
+                self.cache_manager.set(answer_key, result, expire=3600)
+            
+            return result
+            
         except Exception as e:
             logger.error(f"问答处理失败: {str(e)}")
             return {
                 "answer": "处理问题时发生错误，请稍后重试。",
                 "confidence": 0.0,
                 "sources": [],
-                "processing_time": time.time() - start_time,
+                "processing_time": time.perf_counter() - start_time,
                 "success": False,
                 "error": str(e)
             }
@@ -171,12 +417,24 @@ class DocumentAnalysisAgent:
     def generate_summary(self, document_id: str) -> Dict:
         """生成文档摘要"""
         try:
+            summary_key = self.cache_manager.summary_cache_key(document_id)
+            cached_summary = self.cache_manager.get(summary_key)
+            if cached_summary:
+                logger.info(f"命中摘要缓存: {document_id}")
+                return cached_summary
+            
             # 获取文档的所有块（用于生成摘要）
-            search_results = self.vector_store.search_similar_chunks(
-                document_id=document_id,
-                query="文档主要内容 核心观点 关键信息",
-                k=10
-            )
+            summary_query = "文档主要内容 核心观点 关键信息"
+            search_key = self.cache_manager.search_cache_key(document_id, summary_query, 10)
+            search_results = self.cache_manager.get(search_key)
+            if not search_results:
+                search_results = self.vector_store.search_similar_chunks(
+                    document_id=document_id,
+                    query=summary_query,
+                    k=10
+                )
+                if search_results:
+                    self.cache_manager.set(search_key, search_results, expire=3600)
             
             if not search_results:
                 return {
@@ -188,14 +446,16 @@ class DocumentAnalysisAgent:
             content = "\n\n".join([result["content"] for result in search_results[:5]])
             
             # 生成摘要
-            chain = self.summary_prompt | self.llm | StrOutputParser()
-            summary = chain.invoke({"content": content})
+            summary = self._summary_chain.invoke({"content": content})
             
-            return {
+            result = {
                 "summary": summary.strip(),
                 "success": True,
                 "error": None
             }
+            self.cache_manager.set(summary_key, result, expire=3600)
+            
+            return result
             
         except Exception as e:
             logger.error(f"摘要生成失败: {str(e)}")
@@ -207,15 +467,11 @@ class DocumentAnalysisAgent:
     
     def _build_context(self, search_results: List[Dict]) -> str:
         """构建问答上下文"""
-        context_parts = []
-        
-        for i, result in enumerate(search_results, 1):
-            context_parts.append(
-                f"段落 {i} (相似度: {result['similarity_score']:.3f}):\n"
-                f"{result['content']}\n"
-            )
-        
-        return "\n".join(context_parts)
+        fmt = _CONTEXT_PARAGRAPH_FMT
+        return "\n".join(
+            fmt(i, result['similarity_score'], result['content'])
+            for i, result in enumerate(search_results, 1)
+        )
     
     def _calculate_confidence(self, search_results: List[Dict]) -> float:
         """计算回答置信度"""
@@ -223,7 +479,7 @@ class DocumentAnalysisAgent:
             return 0.0
         
         # 基于最高相似度分数计算置信度
-        max_score = max(result["similarity_score"] for result in search_results)
+        max_score = max(map(_SIMILARITY_KEY, search_results))
         
         # 将相似度分数转换为置信度（0-1范围）
         # 这里使用简单的映射，可以根据实际情况调整
@@ -233,68 +489,87 @@ class DocumentAnalysisAgent:
     
     def _prepare_sources(self, search_results: List[Dict]) -> List[Dict]:
         """准备源信息"""
-        sources = []
-        
-        for result in search_results:
-            sources.append({
+        return [
+            {
                 "chunk_id": result["chunk_id"],
                 "chunk_index": result["chunk_index"],
                 "similarity_score": result["similarity_score"],
-                "content_preview": result["content"][:200] + "..." if len(result["content"]) > 200 else result["content"]
-            })
-        
-        return sources
+                "content_preview": _content_preview(result["content"])
+            }
+            for result in search_results
+        ]
 
-    def answer_question_enhanced(
+    async def answer_question_enhanced(
         self, 
         document_id: str, 
         question: str, 
         max_results: int = 5
     ) -> Dict:
         """增强的问答方法 - 包含质量评估和优化"""
-        start_time = time.time()
+        start_time = time.perf_counter()
+        
+        if self._is_degenerate_question(question):
+            return {
+                **self._degenerate_question_response(),
+                "processing_time": time.perf_counter() - start_time,
+                "quality_score": 0.0
+            }
+        
+        # 完全相同的请求直接返回缓存结果
+        cache_key = (document_id, " ".join(question.split()), max_results)
+        cached = self._exact_answer_cache.get(cache_key)
+        if cached:
+            logger.info(f"命中增强问答缓存: {document_id}")
+            return {**cached, "processing_time": time.perf_counter() - start_time}
+        
+        # 相同问题的并发请求共享同一次检索和生成
+        result = await self._coalesce(
+            ("enhanced_qa",) + cache_key,
+            lambda: self._answer_question_enhanced(document_id, question, max_results, cache_key)
+        )
+        return {**result, "processing_time": time.perf_counter() - start_time}
+    
+    async def _answer_question_enhanced(
+        self, 
+        document_id: str, 
+        question: str, 
+        max_results: int, 
+        cache_key: Tuple
+    ) -> Dict:
+        """执行增强问答的检索、生成和评分，成功结果写入精确匹配缓存"""
+        start_time = time.perf_counter()
         
         try:
             # 1. 使用增强向量存储进行混合搜索
-            if hasattr(self.vector_store, 'hybrid_search'):
-                search_results = self.vector_store.hybrid_search(
-                    document_id=document_id,
-                    query=question,
-                    k=max_results
-                )
-            else:
-                search_results = self.vector_store.search_similar_chunks(
-                    document_id=document_id,
-                    query=question,
-                    k=max_results
-                )
+            search_results = await self._aretrieve(document_id, question, max_results)
             
             if not search_results:
                 return {
                     "answer": "抱歉，在该文档中未找到与您问题相关的内容。",
                     "confidence": 0.0,
                     "sources": [],
-                    "processing_time": time.time() - start_time,
+                    "processing_time": time.perf_counter() - start_time,
                     "quality_score": 0.0,
                     "success": True
                 }
             
-            # 2. 智能上下文构建
+            # 2. 按相似度分布自适应裁剪片段数，再构建智能上下文
+            search_results = self._trim_search_results(search_results)
             context = self._build_enhanced_context(search_results, question)
             
             # 3. 生成增强回答
-            answer = self._generate_enhanced_answer(context, question)
+            answer = await self._generate_enhanced_answer(context, question)
             
-            # 4. 计算增强置信度和质量分数
-            confidence = self._calculate_enhanced_confidence(search_results, question, answer)
-            quality_score = self._evaluate_answer_quality(answer, question, search_results)
+            # 4. 在CPU线程池中计算增强置信度和质量分数
+            scores_future = asyncio.ensure_future(self._ascore_answer(search_results, question, answer))
             
-            # 5. 准备详细源信息
+            # 5. 准备详细源信息（与评分并发）
             sources = self._prepare_enhanced_sources(search_results)
+            confidence, quality_score = await scores_future
             
-            processing_time = time.time() - start_time
+            processing_time = time.perf_counter() - start_time
             
-            return {
+            result = {
                 "answer": answer.strip(),
                 "confidence": confidence,
                 "sources": sources,
@@ -305,96 +580,386 @@ class DocumentAnalysisAgent:
                 "error": None
             }
             
+            self._exact_answer_cache.set(cache_key, result)
+            
+            return result
+            
         except Exception as e:
             logger.error(f"增强问答处理失败: {str(e)}")
             return {
                 "answer": "处理问题时发生错误，请稍后重试。",
                 "confidence": 0.0,
                 "sources": [],
-                "processing_time": time.time() - start_time,
+                "processing_time": time.perf_counter() - start_time,
                 "quality_score": 0.0,
                 "success": False,
                 "error": str(e)
             }
     
+    async def astream_answer_enhanced(
+        self, 
+        document_id: str, 
+        question: str, 
+        max_results: int = 5
+    ) -> AsyncIterator[Dict]:
+        """流式增强问答 - 逐段产出 {"delta": ...}，结束时产出 {"final": 完整结果}"""
+        start_time = time.perf_counter()
+        
+        if self._is_degenerate_question(question):
+            yield {"final": {
+                **self._degenerate_question_response(),
+                "processing_time": time.perf_counter() - start_time,
+                "quality_score": 0.0
+            }}
+            return
+        
+        try:
+            # 1. 检索相关内容
+            search_results = await self._aretrieve(document_id, question, max_results)
+            
+            if not search_results:
+                yield {"final": {
+                    "answer": "抱歉，在该文档中未找到与您问题相关的内容。",
+                    "confidence": 0.0,
+                    "sources": [],
+                    "processing_time": time.perf_counter() - start_time,
+                    "quality_score": 0.0,
+                    "success": True
+                }}
+                return
+            
+            # 2. 按相似度分布自适应裁剪片段数，再构建智能上下文
+            search_results = self._trim_search_results(search_results)
+            context = self._build_enhanced_context(search_results, question)
+            
+            # 3. 流式生成回答
+            answer_parts = []
+            async for token in self._astream_tokens(
+                self._enhanced_qa_stream_chain,
+                {"context": context, "question": question},
+                lambda: self._generate_enhanced_answer(context, question)
+            ):
+                answer_parts.append(token)
+                yield {"delta": token}
+            
+            answer = "".join(answer_parts)
+            
+            # 4. 在CPU线程池中计算置信度和质量分数，同时准备源信息
+            scores_future = asyncio.ensure_future(self._ascore_answer(search_results, question, answer))
+            sources = self._prepare_enhanced_sources(search_results)
+            confidence, quality_score = await scores_future
+            
+            yield {"final": {
+                "answer": answer.strip(),
+                "confidence": confidence,
+                "sources": sources,
+                "processing_time": time.perf_counter() - start_time,
+                "quality_score": quality_score,
+                "search_method": "hybrid" if hasattr(self.vector_store, 'hybrid_search') else "vector",
+                "success": True,
+                "error": None
+            }}
+            
+        except Exception as e:
+            logger.error(f"流式增强问答处理失败: {str(e)}")
+            yield {"final": {
+                "answer": "处理问题时发生错误，请稍后重试。",
+                "confidence": 0.0,
+                "sources": [],
+                "processing_time": time.perf_counter() - start_time,
+                "quality_score": 0.0,
+                "success": False,
+                "error": str(e)
+            }}
+    
+    async def astream_answer_question(
+        self, 
+        document_id: str, 
+        question: str, 
+        max_results: int = 5
+    ) -> AsyncIterator[Dict]:
+        """流式问答 - 逐段产出 {"delta": ...}，结束时产出 {"final": 完整结果}，缓存与answer_question共用"""
+        start_time = time.perf_counter()
+        
+        if self._is_degenerate_question(question):
+            yield {"final": {
+                **self._degenerate_question_response(),
+                "processing_time": time.perf_counter() - start_time,
+                "cache_hit": False
+            }}
+            return
+        
+        try:
+            # 1. 命中问答缓存或语义缓存时一次性返回
+            answer_key = self.cache_manager.answer_cache_key(document_id, question, max_results)
+            cached_answer = self.cache_manager.get(answer_key)
+            
+            query_embedding = None
+            if not cached_answer:
+                query_embedding = await self.vector_store.aembed_query(question)
+                if query_embedding:
+                    cached_answer = self.answer_cache.get(document_id, query_embedding, max_results)
+            
+            if cached_answer:
+                yield {"delta": cached_answer["answer"]}
+                yield {"final": {
+                    "answer": cached_answer["answer"],
+                    "confidence": cached_answer["confidence"],
+                    "sources": cached_answer["sources"],
+                    "processing_time": time.perf_counter() - start_time,
+                    "success": True,
+                    "error": None,
+                    "cache_hit": True
+                }}
+                return
+            
+            # 2. 向量搜索相关内容
+            search_results = await self.vector_store.asearch_similar_chunks(
+                document_id, question, max_results, query_embedding
+            )
+            
+            if not search_results:
+                yield {"final": {
+                    "answer": "抱歉，在该文档中未找到与您问题相关的内容。",
+                    "confidence": 0.0,
+                    "sources": [],
+                    "processing_time": time.perf_counter() - start_time,
+                    "success": True,
+                    "error": None,
+                    "cache_hit": False
+                }}
+                return
+            
+            # 3. 流式生成回答
+            context = self._build_context(search_results)
+            inputs = {"context": context, "question": question}
+            answer_parts = []
+            async for token in self._astream_tokens(
+                self._qa_stream_chain, inputs, lambda: self._qa_chain.ainvoke(inputs)
+            ):
+                answer_parts.append(token)
+                yield {"delta": token}
+            
+            answer = "".join(answer_parts).strip()
+            confidence = self._calculate_confidence(search_results)
+            sources = self._prepare_sources(search_results)
+            
+            result = {
+                "answer": answer,
+                "confidence": confidence,
+                "sources": sources,
+                "processing_time": time.perf_counter() - start_time,
+                "success": True,
+                "error": None,
+                "cache_hit": False
+            }
+            
+            if query_embedding:
+                self.answer_cache.put(document_id, query_embedding, answer, sources, confidence, max_results)
+            self.cache_manager.set(answer_key, result, expire=3600)
+            
+            yield {"final": result}
+            
+        except Exception as e:
+            logger.error(f"流式问答处理失败: {str(e)}")
+            yield {"final": {
+                "answer": "处理问题时发生错误，请稍后重试。",
+                "confidence": 0.0,
+                "sources": [],
+                "processing_time": time.perf_counter() - start_time,
+                "success": False,
+                "error": str(e),
+                "cache_hit": False
+            }}
+    
+    async def astream_summary(self, document_id: str) -> AsyncIterator[Dict]:
+        """流式生成文档摘要 - 逐段产出 {"delta": ...}，结束时产出 {"final": 完整结果}"""
+        try:
+            summary_key = self.cache_manager.summary_cache_key(document_id)
+            cached_summary = self.cache_manager.get(summary_key)
+            if cached_summary:
+                yield {"delta": cached_summary["summary"]}
+                yield {"final": cached_summary}
+                return
+            
+            search_results = await self.vector_store.asearch_similar_chunks(
+                document_id, "文档主要内容 核心观点 关键信息", 10
+            )
+            
+            if not search_results:
+                yield {"final": {
+                    "summary": "无法生成摘要：文档内容为空或未找到。",
+                    "success": False
+                }}
+                return
+            
+            inputs = {"content": "\n\n".join([result["content"] for result in search_results[:5]])}
+            summary_parts = []
+            async for token in self._astream_tokens(
+                self._summary_stream_chain, inputs, lambda: self._summary_chain.ainvoke(inputs)
+            ):
+                summary_parts.append(token)
+                yield {"delta": token}
+            
+            result = {
+                "summary": "".join(summary_parts).strip(),
+                "success": True,
+                "error": None
+            }
+            self.cache_manager.set(summary_key, result, expire=3600)
+            
+            yield {"final": result}
+            
+        except Exception as e:
+            logger.error(f"流式摘要生成失败: {str(e)}")
+            yield {"final": {
+                "summary": "生成摘要时发生错误。",
+                "success": False,
+                "error": str(e)
+            }}
+    
+    async def _astream_tokens(
+        self, 
+        stream_chain, 
+        inputs: Dict, 
+        fallback: Callable[[], Awaitable[str]]
+    ) -> AsyncIterator[str]:
+        """逐段产出流式生成内容；尚未输出任何内容时失败则降级为一次性生成"""
+        emitted = False
+        try:
+            async for token in stream_chain.astream(inputs):
+                if token:
+                    emitted = True
+                    yield token
+        except Exception as e:
+            if emitted:
+                raise
+            logger.warning(f"流式生成失败，降级为一次性生成: {str(e)}")
+            yield await fallback()
+    
+    def invalidate_document_caches(self, document_id: str):
+        """文档删除或重新处理后丢弃该文档的全部缓存：问答（精确/语义）、摘要、搜索结果和检索索引"""
+        self._exact_answer_cache.invalidate_where(lambda key: key[0] == document_id)
+        self.answer_cache.invalidate(document_id)
+        self.cache_manager.invalidate_document(document_id)
+        if hasattr(self.vector_store, 'invalidate_document_caches'):
+            self.vector_store.invalidate_document_caches(document_id)
+    
+    async def _coalesce(self, key: Tuple, factory: Callable[[], Awaitable[Dict]]) -> Dict:
+        """合并进行中的相同请求：首个调用方创建任务，后续调用方等待同一任务的结果"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            logger.info(f"合并进行中的相同请求: {key[0]}")
+        
+        # shield: 某个调用方被取消（如客户端断开）时不影响其他等待者
+        return await asyncio.shield(task)
+    
+    def _is_degenerate_question(self, question: str) -> bool:
+        """空白或过短的问题不值得执行检索和生成"""
+        return not question or len(question.strip()) < _MIN_QUESTION_LENGTH
+    
+    def _degenerate_question_response(self) -> Dict:
+        """过短问题的统一响应"""
+        return {
+            "answer": "问题过短，请输入更具体的问题。",
+            "confidence": 0.0,
+            "sources": [],
+            "success": True,
+            "error": None
+        }
+    
+    async def _aretrieve(self, document_id: str, question: str, k: int) -> List[Dict]:
+        """检索相关内容：优先混合搜索，否则使用向量搜索"""
+        if hasattr(self.vector_store, 'hybrid_search'):
+            return await self.vector_store.ahybrid_search(
+                document_id=document_id,
+                query=question,
+                k=k
+            )
+        
+        return await self.vector_store.asearch_similar_chunks(
+            document_id=document_id,
+            query=question,
+            k=k
+        )
+    
+    async def _ascore_answer(
+        self, 
+        search_results: List[Dict], 
+        question: str, 
+        answer: str
+    ) -> Tuple[float, float]:
+        """在CPU线程池中并发计算增强置信度和质量分数"""
+        loop = asyncio.get_running_loop()
+        confidence, quality_score = await asyncio.gather(
+            loop.run_in_executor(_CPU_POOL, self._calculate_enhanced_confidence, search_results, question, answer),
+            loop.run_in_executor(_CPU_POOL, self._evaluate_answer_quality, answer, question, search_results)
+        )
+        return confidence, quality_score
+    
+    def _trim_search_results(self, search_results: List[Dict]) -> List[Dict]:
+        """按累计相似度占比裁剪检索结果（结果已按相似度降序），减少送入模型的上下文"""
+        if len(search_results) <= _MIN_CONTEXT_RESULTS:
+            return search_results
+        
+        # 累计相似度单调不减，可直接二分查找达到覆盖率的位置
+        cumulative_scores = list(itertools.accumulate(max(score, 0.0) for score in map(_SIMILARITY_KEY, search_results)))
+        total_score = cumulative_scores[-1]
+        if total_score <= 0:
+            return search_results
+        
+        keep = max(bisect.bisect_left(cumulative_scores, total_score * _CONTEXT_SCORE_COVERAGE) + 1, _MIN_CONTEXT_RESULTS)
+        if keep < len(search_results):
+            logger.info(f"自适应上下文: 使用 {keep}/{len(search_results)} 个片段")
+        return search_results[:keep]
+    
     def _build_enhanced_context(self, search_results: List[Dict], question: str) -> str:
         """构建增强的问答上下文"""
         context_parts = []
         
-        # 按相似度和质量分数排序
-        sorted_results = sorted(
-            search_results, 
-            key=lambda x: (x['similarity_score'] * x.get('metadata', {}).get('quality_score', 0.5)),
-            reverse=True
-        )
-        
-        for i, result in enumerate(sorted_results, 1):
-            metadata = result.get('metadata', {})
+        # 按相似度和质量分数排序（排序键只计算一次）
+        keyed_results = []
+        for result in search_results:
+            metadata = result.get('metadata') or _EMPTY_METADATA
             quality_score = metadata.get('quality_score', 0.5)
+            keyed_results.append((result['similarity_score'] * quality_score, quality_score, metadata, result))
+        keyed_results.sort(key=operator.itemgetter(0), reverse=True)
+        
+        for i, (_, quality_score, metadata, result) in enumerate(keyed_results, 1):
             keywords = metadata.get('keywords', [])
             
-            # 构建增强的上下文段落
-            context_part = f"【文档片段 {i}】(相似度: {result['similarity_score']:.3f}, 质量: {quality_score:.2f})\n"
-            
             # 如果有关键词，添加关键词信息
-            if keywords:
-                context_part += f"关键词: {', '.join(keywords[:5])}\n"
+            keyword_line = f"关键词: {', '.join(keywords[:5])}\n" if keywords else ""
             
-            context_part += f"内容: {result['content']}\n"
-            context_parts.append(context_part)
+            # 构建增强的上下文段落（一次格式化，避免逐段拼接产生中间字符串）
+            context_parts.append(
+                f"【文档片段 {i}】(相似度: {result['similarity_score']:.3f}, 质量: {quality_score:.2f})\n"
+                f"{keyword_line}内容: {result['content']}\n"
+            )
         
         return "\n".join(context_parts)
     
-    def _generate_enhanced_answer(self, context: str, question: str) -> str:
+    async def _generate_enhanced_answer(self, context: str, question: str) -> str:
         """生成增强的回答"""
         try:
-            # 使用增强的提示词模板
-            enhanced_prompt = ChatPromptTemplate.from_template("""
-你是一个专业的中文文献分析助手，具备深厚的学术背景和文献理解能力。请基于提供的文档内容，准确、专业地回答用户的问题。
-
-【文档相关内容】
-{context}
-
-【用户问题】
-{question}
-
-【回答要求】
-1. 严格基于提供的文档内容进行回答，确保信息准确性
-2. 如果文档中缺少直接相关信息，请明确指出并尽可能提供相关背景
-3. 保持回答的学术性和客观性，使用准确的专业术语
-4. 适当引用原文关键段落或数据支持你的回答
-5. 回答要条理清晰，逻辑连贯，便于理解
-6. 如果问题涉及多个方面，请分点详细说明
-7. 回答长度要适中，既要全面又要简洁
-
-【专业回答】
-""")
-            
-            # 尝试使用链式调用
-            try:
-                chain = enhanced_prompt | self.llm | StrOutputParser()
-                answer = chain.invoke({
-                    "context": context,
-                    "question": question
-                })
-            except Exception as e:
-                # 降级到直接调用
-                logger.warning(f"链式调用失败，使用直接调用: {str(e)}")
-                prompt_text = enhanced_prompt.format(context=context, question=question)
-                answer = self.llm.predict(prompt_text)
-            
-            return answer
+            return await self._enhanced_qa_chain.ainvoke({
+                "context": context,
+                "question": question
+            })
             
         except Exception as e:
             logger.error(f"生成增强回答失败: {str(e)}")
             # 降级到基础回答生成
-            return self._generate_basic_answer(context, question)
+            return await self._generate_basic_answer(context, question)
     
-    def _generate_basic_answer(self, context: str, question: str) -> str:
+    async def _generate_basic_answer(self, context: str, question: str) -> str:
         """生成基础回答（降级方案）"""
         try:
-            chain = self.qa_prompt | self.llm | StrOutputParser()
-            return chain.invoke({"context": context, "question": question})
+            return await self._qa_chain.ainvoke({"context": context, "question": question})
         except Exception as e:
             logger.error(f"基础回答生成也失败: {str(e)}")
             return "抱歉，生成回答时遇到技术问题，请稍后重试。"
@@ -409,14 +974,16 @@ class DocumentAnalysisAgent:
         if not search_results:
             return 0.0
         
-        # 基础相似度置信度
-        base_confidence = max(result["similarity_score"] for result in search_results)
+        # 单次遍历同时计算基础相似度置信度和质量加权置信度
+        base_confidence = float("-inf")
+        weighted_sum = 0.0
+        for result in search_results:
+            similarity = result["similarity_score"]
+            if similarity > base_confidence:
+                base_confidence = similarity
+            weighted_sum += similarity * (result.get('metadata') or _EMPTY_METADATA).get('quality_score', 0.5)
         
-        # 质量加权置信度
-        quality_weighted_confidence = sum(
-            result["similarity_score"] * result.get('metadata', {}).get('quality_score', 0.5)
-            for result in search_results
-        ) / len(search_results)
+        quality_weighted_confidence = weighted_sum / len(search_results)
         
         # 覆盖度置信度（多个结果一致性）
         coverage_confidence = min(len(search_results) / 3.0, 1.0)
@@ -445,18 +1012,12 @@ class DocumentAnalysisAgent:
             structure_score = 0.5
             
             # 检查是否有完整句子
-            if any(punct in answer for punct in ['。', '！', '？', '.', '!', '?']):
+            if _SENTENCE_ENDING_RE.search(answer):
                 structure_score += 0.2
             
             # 检查是否直接回应了问题
-            import jieba
-            question_words = set(jieba.cut(question.lower()))
-            answer_words = set(jieba.cut(answer.lower()))
-            
-            # 移除停用词
-            stop_words = {'的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一', '一个'}
-            question_words = question_words - stop_words
-            answer_words = answer_words - stop_words
+            question_words = _tokenize(question)
+            answer_words = _tokenize(answer)
             
             if question_words and answer_words:
                 word_overlap = len(question_words & answer_words) / len(question_words)
@@ -485,8 +1046,15 @@ class DocumentAnalysisAgent:
             elif 20 <= answer_length < 50 or 800 < answer_length <= 1500:
                 quality_score += 0.1
             
+            # 回答和各检索片段的分词结果只计算一次，供各项指标共享
+            answer_words = _tokenize(answer)
+            chunk_words = [
+                _tokenize_chunk(result.get('chunk_id', ''), result['content'])
+                for result in search_results
+            ]
+            
             # 2. 内容相关性 (30%)
-            relevance_score = self._calculate_content_relevance(answer, search_results)
+            relevance_score = self._calculate_content_relevance(answer_words, chunk_words)
             quality_score += relevance_score * 0.3
             
             # 3. 语言流畅性 (25%)
@@ -503,18 +1071,14 @@ class DocumentAnalysisAgent:
             logger.warning(f"回答质量评估失败: {e}")
             return 0.5
     
-    def _calculate_content_relevance(self, answer: str, search_results: List[Dict]) -> float:
-        """计算内容相关性"""
+    def _calculate_content_relevance(self, answer_words: frozenset, chunk_words: List[frozenset]) -> float:
+        """计算内容相关性（基于已分词的回答和检索片段）"""
         try:
-            import jieba
-            answer_words = set(jieba.cut(answer.lower()))
-            
             # 计算与检索结果的词汇重叠度
             total_overlap = 0
             total_words = 0
             
-            for result in search_results:
-                content_words = set(jieba.cut(result['content'].lower()))
+            for content_words in chunk_words:
                 if content_words:
                     overlap = len(answer_words & content_words)
                     total_overlap += overlap
@@ -535,13 +1099,11 @@ class DocumentAnalysisAgent:
             fluency_score = 0.5
             
             # 检查句子完整性
-            sentence_endings = len([c for c in answer if c in '。！？.!?'])
-            if sentence_endings > 0:
+            if _SENTENCE_ENDING_RE.search(answer):
                 fluency_score += 0.2
             
             # 检查逻辑连接词
-            logical_connectors = ['因为', '所以', '但是', '然而', '此外', '另外', '首先', '其次', '最后', '总之']
-            if any(connector in answer for connector in logical_connectors):
+            if _LOGICAL_CONNECTOR_RE.search(answer):
                 fluency_score += 0.2
             
             # 检查重复内容
@@ -562,18 +1124,15 @@ class DocumentAnalysisAgent:
             accuracy_score = 0.7  # 基础准确性假设
             
             # 检查是否包含明确的不确定性表述（好的做法）
-            uncertainty_phrases = ['可能', '大概', '据文档显示', '根据资料', '文档中提到']
-            if any(phrase in answer for phrase in uncertainty_phrases):
+            if _UNCERTAINTY_PHRASE_RE.search(answer):
                 accuracy_score += 0.2
             
-            # 检查是否直接引用了文档内容
-            for result in search_results:
-                content = result['content']
-                # 检查是否有较长的重复片段（可能是直接引用）
-                for i in range(len(answer) - 20):
-                    if answer[i:i+20] in content:
+            # 检查是否直接引用了文档内容（较长的重复片段可能是直接引用）
+            if len(answer) >= _QUOTE_SHINGLE_LEN:
+                contains_quote = self._build_quote_matcher(answer)
+                for result in search_results:
+                    if contains_quote(result['content']):
                         accuracy_score += 0.1
-                        break
             
             return min(accuracy_score, 1.0)
             
@@ -581,65 +1140,90 @@ class DocumentAnalysisAgent:
             logger.warning(f"信息准确性评估失败: {e}")
             return 0.7
     
+    def _build_quote_matcher(self, answer: str):
+        """构建引用匹配器：判断内容是否包含回答中任意长度为 _QUOTE_SHINGLE_LEN 的片段"""
+        # 片段集合每个回答只计算一次，所有检索结果共享
+        shingles = frozenset(
+            answer[i:i + _QUOTE_SHINGLE_LEN]
+            for i in range(len(answer) - _QUOTE_SHINGLE_LEN + 1)
+        )
+        
+        if AHOCORASICK_AVAILABLE:
+            automaton = ahocorasick.Automaton()
+            for shingle in shingles:
+                automaton.add_word(shingle, shingle)
+            automaton.make_automaton()
+            return lambda content: next(automaton.iter(content), None) is not None
+        
+        # 降级：逐个片段做子串查找（C层面搜索，不再为内容的每个位置分配子串），命中即返回
+        return lambda content: any(shingle in content for shingle in shingles)
+    
     def _prepare_enhanced_sources(self, search_results: List[Dict]) -> List[Dict]:
         """准备增强的源信息"""
         sources = []
         
         for result in search_results:
-            metadata = result.get('metadata', {})
+            metadata = result.get('metadata') or _EMPTY_METADATA
+            content = result["content"]
             
-            source_info = {
+            sources.append({
                 "chunk_id": result["chunk_id"],
                 "chunk_index": result["chunk_index"],
                 "similarity_score": result["similarity_score"],
                 "quality_score": metadata.get("quality_score", 0.5),
                 "keywords": metadata.get("keywords", []),
                 "summary": metadata.get("summary", ""),
-                "content_preview": result["content"][:200] + "..." if len(result["content"]) > 200 else result["content"],
-                "content_length": len(result["content"])
-            }
-            
-            sources.append(source_info)
+                "content_preview": _content_preview(content),
+                "content_length": len(content)
+            })
         
         return sources
 
-    def generate_summary_enhanced(self, document_id: str) -> Dict:
-        """生成增强的文档摘要"""
+    async def generate_summary_enhanced(self, document_id: str) -> Dict:
+        """生成增强的文档摘要（同一文档的并发请求共享同一次生成）"""
+        return await self._coalesce(
+            ("enhanced_summary", document_id),
+            lambda: self._generate_summary_enhanced(document_id)
+        )
+    
+    async def _generate_summary_enhanced(self, document_id: str) -> Dict:
+        """检索高质量片段并生成增强摘要"""
         try:
             # 1. 获取高质量的文档片段用于摘要
             if hasattr(self.vector_store, 'hybrid_search'):
-                # 使用多个关键词进行综合搜索
+                # 使用多个关键词进行综合搜索（相互独立，并发执行）
                 summary_queries = [
                     "文档主要内容 核心观点 关键信息",
                     "研究方法 实验结果 重要发现",
                     "结论 建议 总结"
                 ]
                 
-                all_results = []
-                for query in summary_queries:
-                    results = self.vector_store.hybrid_search(
+                results_lists = await asyncio.gather(*(
+                    self.vector_store.ahybrid_search(
                         document_id=document_id,
                         query=query,
                         k=5
                     )
-                    all_results.extend(results)
+                    for query in summary_queries
+                ))
+                all_results = list(itertools.chain.from_iterable(results_lists))
                 
-                # 去重并按质量排序
+                # 去重（同一片段被多个查询命中时保留最高分）并按质量排序
                 unique_results = {}
                 for result in all_results:
-                    chunk_id = result['chunk_id']
-                    if chunk_id not in unique_results:
-                        unique_results[chunk_id] = result
+                    previous = unique_results.get(result['chunk_id'])
+                    if previous is None or result['similarity_score'] > previous['similarity_score']:
+                        unique_results[result['chunk_id']] = result
                 
-                search_results = list(unique_results.values())
-                search_results.sort(
-                    key=lambda x: x['similarity_score'] * x.get('metadata', {}).get('quality_score', 0.5),
-                    reverse=True
-                )
-                search_results = search_results[:8]  # 取前8个最优质的片段
+                scored_results = [
+                    (result['similarity_score'] * (result.get('metadata') or _EMPTY_METADATA).get('quality_score', 0.5), result)
+                    for result in unique_results.values()
+                ]
+                top_results = heapq.nlargest(8, scored_results, key=operator.itemgetter(0))
+                search_results = [result for _, result in top_results]  # 取前8个最优质的片段
                 
             else:
-                search_results = self.vector_store.search_similar_chunks(
+                search_results = await self.vector_store.asearch_similar_chunks(
                     document_id=document_id,
                     query="文档主要内容 核心观点 关键信息",
                     k=8
@@ -657,8 +1241,10 @@ class DocumentAnalysisAgent:
             # 2. 构建结构化内容用于摘要
             content_sections = self._organize_content_for_summary(search_results)
             
-            # 3. 生成增强摘要
-            summary = self._generate_structured_summary(content_sections)
+            # 3. 生成增强摘要（优先分段并发摘要再汇总，失败时降级为单次摘要）
+            summary = await self._generate_map_reduce_summary(search_results)
+            if not summary:
+                summary = await self._generate_structured_summary(content_sections)
             
             # 4. 提取关键要点和关键词
             key_points = self._extract_key_points(search_results)
@@ -716,7 +1302,34 @@ class DocumentAnalysisAgent:
         
         return content_sections
     
-    def _generate_structured_summary(self, content_sections: Dict) -> str:
+    async def _generate_map_reduce_summary(self, search_results: List[Dict]) -> Optional[str]:
+        """分段摘要后汇总（map-reduce），各片段摘要并发生成"""
+        if not hasattr(self.llm, 'abatch'):
+            return None
+        
+        try:
+            # map：并发概括每个片段
+            partial_summaries = await self._map_summary_chain.abatch(
+                [{"content": result['content']} for result in search_results],
+                config={"max_concurrency": _MAP_SUMMARY_CONCURRENCY}
+            )
+            
+            parts = "\n\n".join(
+                f"片段 {i}：{part.strip()}"
+                for i, part in enumerate(partial_summaries, 1)
+                if part and part.strip()
+            )
+            if not parts:
+                return None
+            
+            # reduce：综合各片段要点
+            return await self._reduce_summary_chain.ainvoke({"parts": parts})
+            
+        except Exception as e:
+            logger.warning(f"分段汇总摘要失败，降级为单次摘要: {str(e)}")
+            return None
+    
+    async def _generate_structured_summary(self, content_sections: Dict) -> str:
         """生成结构化摘要"""
         try:
             # 构建分层内容
@@ -732,50 +1345,22 @@ class DocumentAnalysisAgent:
                 unique_concepts = list(set(content_sections["key_concepts"][:15]))
                 content_for_summary += f"\n\n【关键概念】\n{', '.join(unique_concepts)}"
             
-            # 使用增强的摘要提示词
-            enhanced_summary_prompt = ChatPromptTemplate.from_template("""
-请为以下学术文档生成一份高质量的中文摘要，要求结构清晰、内容准确、重点突出。
-
-【文档内容】
-{content}
-
-【摘要生成要求】
-1. 准确概括文档的核心观点、主要发现和重要结论
-2. 突出文档的学术价值和创新点
-3. 保持逻辑结构清晰，语言表达准确流畅
-4. 摘要长度控制在300-600字之间
-5. 使用规范的学术写作风格
-6. 如果涉及数据或实验结果，请准确提及
-7. 分段组织，便于阅读理解
-
-【结构化摘要】
-""")
-            
             # 生成摘要
-            try:
-                chain = enhanced_summary_prompt | self.llm | StrOutputParser()
-                summary = chain.invoke({"content": content_for_summary})
-            except Exception as e:
-                logger.warning(f"链式调用失败，使用直接调用: {str(e)}")
-                prompt_text = enhanced_summary_prompt.format(content=content_for_summary)
-                summary = self.llm.predict(prompt_text)
-            
-            return summary
+            return await self._enhanced_summary_chain.ainvoke({"content": content_for_summary})
             
         except Exception as e:
             logger.error(f"结构化摘要生成失败: {str(e)}")
             # 降级到基础摘要
-            return self._generate_basic_summary(content_sections)
+            return await self._generate_basic_summary(content_sections)
     
-    def _generate_basic_summary(self, content_sections: Dict) -> str:
+    async def _generate_basic_summary(self, content_sections: Dict) -> str:
         """生成基础摘要（降级方案）"""
         try:
             content = "\n\n".join(content_sections.get("high_quality", [])[:3])
             if not content:
                 content = "文档内容"
             
-            chain = self.summary_prompt | self.llm | StrOutputParser()
-            return chain.invoke({"content": content})
+            return await self._summary_chain.ainvoke({"content": content})
         except Exception as e:
             logger.error(f"基础摘要生成失败: {str(e)}")
             return "无法生成文档摘要，请稍后重试。"
@@ -783,22 +1368,15 @@ class DocumentAnalysisAgent:
     def _extract_key_points(self, search_results: List[Dict]) -> List[str]:
         """提取关键要点"""
         key_points = []
+        seen = set()
         
         try:
             for result in search_results[:5]:  # 取前5个高质量结果
-                content = result['content']
-                
                 # 寻找明确的要点（如编号列表、重要结论等）
-                lines = content.split('\n')
-                for line in lines:
-                    line = line.strip()
-                    # 识别要点模式
-                    if (any(line.startswith(prefix) for prefix in ['1.', '2.', '3.', '一、', '二、', '三、', '•', '-']) or
-                        any(keyword in line for keyword in ['重要', '关键', '核心', '主要', '结论', '发现']) and
-                        10 <= len(line) <= 200):
-                        
-                        if line not in key_points:
-                            key_points.append(line)
+                for line in _chunk_key_point_lines(result.get('chunk_id', ''), result['content']):
+                    if line not in seen:
+                        seen.add(line)
+                        key_points.append(line)
                 
                 if len(key_points) >= 8:
                     break
@@ -812,22 +1390,16 @@ class DocumentAnalysisAgent:
     def _extract_summary_keywords(self, search_results: List[Dict]) -> List[str]:
         """提取摘要关键词"""
         try:
-            all_keywords = []
-            
-            # 从元数据中收集关键词
+            # 从元数据中收集关键词并增量统计频率
+            keyword_counts = Counter()
             for result in search_results:
-                metadata = result.get('metadata', {})
-                keywords = metadata.get('keywords', [])
-                all_keywords.extend(keywords)
-            
-            # 统计关键词频率并去重
-            from collections import Counter
-            keyword_counts = Counter(all_keywords)
+                metadata = result.get('metadata') or _EMPTY_METADATA
+                keyword_counts.update(metadata.get('keywords', ()))
             
             # 返回出现频率最高的关键词
-            top_keywords = [kw for kw, count in keyword_counts.most_common(15)]
+            top_keywords = heapq.nlargest(15, keyword_counts.items(), key=operator.itemgetter(1))
             
-            return top_keywords
+            return [kw for kw, count in top_keywords]
             
         except Exception as e:
             logger.warning(f"摘要关键词提取失败: {e}")
@@ -866,14 +1438,12 @@ class DocumentAnalysisAgent:
     def _calculate_content_coverage(self, summary: str, search_results: List[Dict]) -> float:
         """计算内容覆盖度"""
         try:
-            import jieba
-            summary_words = set(jieba.cut(summary.lower()))
+            summary_words = _tokenize(summary)
             
             # 计算与源内容的重叠度
             total_source_words = set()
             for result in search_results[:5]:
-                source_words = set(jieba.cut(result['content'].lower()))
-                total_source_words.update(source_words)
+                total_source_words.update(_tokenize_chunk(result.get('chunk_id', ''), result['content']))
             
             if total_source_words:
                 coverage = len(summary_words & total_source_words) / len(total_source_words)
@@ -1,39 +1,112 @@
 import json
+import time
+import functools
+import heapq
 import hashlib
 import logging
-from typing import Any, Optional, Dict, List
-from datetime import datetime, timedelta
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Dict, List, Callable
 import os
 
 logger = logging.getLogger(__name__)
 
+@functools.lru_cache(maxsize=4096)
+def _hash_key(prefix: str, data: str) -> str:
+    """生成缓存键（非加密用途，使用比md5更快的blake2b；重复的查询直接命中lru_cache）"""
+    hash_value = hashlib.blake2b(data.encode('utf-8'), digest_size=16).hexdigest()
+    return f"{prefix}:{hash_value}"
+
+class MemoCache:
+    """进程内有界TTL LRU缓存 - 放在共享缓存前面，热点键直接命中；键为任意可哈希对象，无需生成哈希键"""
+    
+    def __init__(self, maxsize: int = 1024, ttl: int = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, 过期时间)，队首为最久未使用
+        self._lock = threading.Lock()
+    
+    def get(self, key: Any) -> Optional[Any]:
+        """获取未过期的值"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            
+            value, expiry_ts = entry
+            if expiry_ts < time.monotonic():
+                del self._entries[key]
+                return None
+            
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key: Any, value: Any):
+        """写入缓存，超出容量时淘汰最久未使用的项"""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def invalidate_where(self, predicate: Callable[[Any], bool]) -> int:
+        """删除键满足条件的所有项（如某文档的全部条目），返回删除数量"""
+        with self._lock:
+            stale_keys = [key for key in self._entries if predicate(key)]
+            for key in stale_keys:
+                del self._entries[key]
+            return len(stale_keys)
+
 class CacheManager:
-    """简化的缓存管理器 - 只使用内存缓存"""
+    """简化的缓存管理器 - 内存缓存，可选追加日志持久化以便重启后恢复"""
     
-    def __init__(self):
-        self.memory_cache = {}
+    def __init__(self, wal_path: Optional[str] = None):
+        self.memory_cache = OrderedDict()  # key -> (value, 过期时间)，按访问顺序排列，队首为最久未使用
         self.memory_cache_maxsize = 1000
-        self.cache_timestamps = {}  # 存储缓存时间戳
+        self._exp_heap = []  # (过期时间, key) 小顶堆，过期时间基于time.monotonic
+        # 缓存会在线程池（检索、嵌入）中读写，内存缓存和过期堆的修改都在此锁内进行；
+        # 需要同时持有两把锁时先取_lock再取_wal_lock
+        self._lock = threading.RLock()
         
-        logger.info("缓存管理器初始化完成（内存缓存模式）")
+        # 可选的磁盘持久化：每次写入追加一行JSON记录，启动时回放恢复未过期的条目
+        self._wal_path = wal_path or os.getenv("CACHE_WAL_PATH")
+        self._wal_file = None
+        self._wal_records = 0
+        self._wal_lock = threading.Lock()
+        
+        if self._wal_path:
+            self._load_wal()
+            logger.info(f"缓存管理器初始化完成（内存缓存 + 持久化日志: {self._wal_path}，恢复 {len(self.memory_cache)} 条）")
+        else:
+            logger.info("缓存管理器初始化完成（内存缓存模式）")
     
     def _generate_key(self, prefix: str, data: str) -> str:
         """生成缓存键"""
-        hash_value = hashlib.md5(data.encode('utf-8')).hexdigest()
-        return f"{prefix}:{hash_value}"
+        return _hash_key(prefix, data)
     
-    def _is_expired(self, key: str, expire: int) -> bool:
+    def _is_expired(self, key: str) -> bool:
         """检查缓存是否过期"""
-        if key not in self.cache_timestamps:
+        entry = self.memory_cache.get(key)
+        if entry is None:
             return True
         
-        cache_time = self.cache_timestamps[key]
-        return (datetime.now() - cache_time).total_seconds() > expire
+        return entry[1] < time.monotonic()
     
     def get(self, key: str) -> Optional[Any]:
-        """获取缓存值"""
+        """获取缓存值（已过期的条目视为未命中并移除）"""
         try:
-            return self.memory_cache.get(key)
+            with self._lock:
+                entry = self.memory_cache.get(key)
+                if entry is None:
+                    return None
+                
+                value, expiry_ts = entry
+                if expiry_ts < time.monotonic():
+                    self.delete(key)
+                    return None
+                
+                self.memory_cache.move_to_end(key)
+                return value
         except Exception as e:
             logger.error(f"缓存获取失败: {e}")
         return None
@@ -41,60 +114,160 @@ class CacheManager:
     def set(self, key: str, value: Any, expire: int = 3600) -> bool:
         """设置缓存值"""
         try:
-            # 内存缓存简单LRU实现
-            if len(self.memory_cache) >= self.memory_cache_maxsize:
-                # 删除最旧的项
-                oldest_key = next(iter(self.memory_cache))
-                del self.memory_cache[oldest_key]
-                if oldest_key in self.cache_timestamps:
-                    del self.cache_timestamps[oldest_key]
-            
-            self.memory_cache[key] = value
-            self.cache_timestamps[key] = datetime.now()
+            with self._lock:
+                self._store(key, value, time.monotonic() + expire)
+                self._append_wal({"k": key, "v": value, "e": time.time() + expire})
             return True
         except Exception as e:
             logger.error(f"缓存设置失败: {e}")
         return False
     
+    def _store(self, key: str, value: Any, expiry_ts: float):
+        """写入内存缓存（expiry_ts基于time.monotonic）"""
+        with self._lock:
+            # 内存缓存LRU实现
+            if key in self.memory_cache:
+                self.memory_cache.move_to_end(key)
+            elif len(self.memory_cache) >= self.memory_cache_maxsize:
+                # 删除最久未使用的项（堆中残留的记录在清理时跳过）
+                self.memory_cache.popitem(last=False)
+            
+            self.memory_cache[key] = (value, expiry_ts)
+            heapq.heappush(self._exp_heap, (expiry_ts, key))
+            
+            # 覆盖写入和LRU淘汰会在堆中留下失效记录，积累过多时重建
+            if len(self._exp_heap) > 2 * self.memory_cache_maxsize:
+                self._exp_heap = [(entry[1], k) for k, entry in self.memory_cache.items()]
+                heapq.heapify(self._exp_heap)
+    
     def delete(self, key: str) -> bool:
         """删除缓存"""
         try:
-            if key in self.memory_cache:
-                del self.memory_cache[key]
-            if key in self.cache_timestamps:
-                del self.cache_timestamps[key]
+            with self._lock:
+                if self.memory_cache.pop(key, None) is not None:
+                    self._append_wal({"k": key, "d": 1})
             return True
         except Exception as e:
             logger.error(f"缓存删除失败: {e}")
         return False
     
     def clear_expired(self):
-        """清理过期缓存"""
+        """清理过期缓存 - 只弹出堆顶已到期的记录，无需全量扫描"""
         try:
-            current_time = datetime.now()
-            expired_keys = []
+            current_time = time.monotonic()
+            expired_count = 0
             
-            for key, timestamp in self.cache_timestamps.items():
-                if (current_time - timestamp).total_seconds() > 3600:  # 默认1小时过期
-                    expired_keys.append(key)
-            
-            for key in expired_keys:
-                self.delete(key)
+            with self._lock:
+                while self._exp_heap and self._exp_heap[0][0] <= current_time:
+                    expiry_ts, key = heapq.heappop(self._exp_heap)
+                    entry = self.memory_cache.get(key)
+                    # 跳过已删除或已被重新写入（过期时间更新）的失效记录
+                    if entry is None or entry[1] != expiry_ts:
+                        continue
+                    del self.memory_cache[key]
+                    expired_count += 1
                 
-            if expired_keys:
-                logger.info(f"清理了 {len(expired_keys)} 个过期缓存")
+            if expired_count:
+                logger.info(f"清理了 {expired_count} 个过期缓存")
+            
+            # 日志中的失效记录（覆盖、删除、过期）过多时压缩
+            if self._wal_file and self._wal_compaction_due():
+                self._compact_wal()
                 
         except Exception as e:
             logger.error(f"清理过期缓存失败: {e}")
     
+    def _load_wal(self):
+        """回放持久化日志恢复未过期的缓存，然后压缩日志并打开追加句柄"""
+        try:
+            if os.path.exists(self._wal_path):
+                now_wall, now_mono = time.time(), time.monotonic()
+                with open(self._wal_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # 进程异常退出可能留下不完整的末行
+                            continue
+                        
+                        key = record["k"]
+                        if record.get("d"):
+                            self.memory_cache.pop(key, None)
+                        elif record["e"] > now_wall:
+                            self._store(key, record["v"], now_mono + (record["e"] - now_wall))
+            
+            self._compact_wal()
+            
+        except Exception as e:
+            logger.error(f"缓存持久化日志加载失败，仅使用内存缓存: {e}")
+            self._wal_file = None
+    
+    def _append_wal(self, record: Dict):
+        """追加一条持久化记录（值无法序列化为JSON时只保留在内存中）"""
+        if self._wal_file is None:
+            return
+        
+        try:
+            line = json.dumps(record, ensure_ascii=False) + "\n"
+        except (TypeError, ValueError):
+            return
+        
+        with self._wal_lock:
+            self._wal_file.write(line)
+            self._wal_file.flush()
+            self._wal_records += 1
+        
+        # 覆盖、删除和过期留下的失效记录过多时压缩（调用方持有_lock，锁顺序不变）
+        if self._wal_compaction_due():
+            self._compact_wal()
+    
+    def _wal_compaction_due(self) -> bool:
+        """日志记录数超过有效条目上限的两倍时需要压缩"""
+        return self._wal_records > 2 * max(len(self.memory_cache), self.memory_cache_maxsize)
+    
+    def _compact_wal(self):
+        """只保留当前有效的条目重写日志"""
+        with self._lock, self._wal_lock:
+            if self._wal_file is not None:
+                self._wal_file.close()
+            
+            now_wall, now_mono = time.time(), time.monotonic()
+            lines = []
+            for key, (value, expiry_ts) in list(self.memory_cache.items()):
+                if expiry_ts <= now_mono:
+                    continue
+                try:
+                    lines.append(json.dumps({"k": key, "v": value, "e": now_wall + (expiry_ts - now_mono)}, ensure_ascii=False))
+                except (TypeError, ValueError):
+                    continue
+            
+            tmp_path = f"{self._wal_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(line + "\n" for line in lines)
+            os.replace(tmp_path, self._wal_path)
+            
+            self._wal_file = open(self._wal_path, "a", encoding="utf-8")
+            self._wal_records = len(lines)
+    
     def search_cache_key(self, document_id: str, query: str, k: int) -> str:
-        """生成搜索缓存键"""
-        cache_data = f"{document_id}:{query}:{k}"
-        return self._generate_key("search", cache_data)
+        """生成搜索缓存键（文档ID明文保留在键中，以便按文档失效）"""
+        return self._generate_key(f"search:{document_id}", f"{query}:{k}")
+    
+    def answer_cache_key(self, document_id: str, question: str, k: int) -> str:
+        """生成问答缓存键（文档ID明文保留在键中，以便按文档失效）"""
+        return self._generate_key(f"answer:{document_id}", f"{question}:{k}")
     
     def summary_cache_key(self, document_id: str) -> str:
         """生成摘要缓存键"""
-        return self._generate_key("summary", document_id)
+        return f"summary:{document_id}"
+    
+    def invalidate_document(self, document_id: str) -> int:
+        """删除某文档的全部搜索、问答和摘要缓存（文档删除或重新处理时调用），返回删除数量"""
+        with self._lock:
+            stale_keys = [key for key in self.memory_cache if key.split(":", 2)[1:2] == [document_id]]
+            for key in stale_keys:
+                self.delete(key)
+        return len(stale_keys)
 
 # 全局缓存实例
 cache_manager = CacheManager() 
\ No newline at end of file
@@ -3,16 +3,109 @@ import os
 import hashlib
 import re
 import numpy as np
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Union
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from ..utils.file_storage import file_storage_manager
 import logging
 import jieba
 import jieba.analyse
-import tempfile
+import threading
+import functools
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 logger = logging.getLogger(__name__)
 
+# 提取结构化文本时不携带图片数据，扫描版页面无需解码和复制图像字节
+_PAGE_DICT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+_PAGE_BLOCKS_FLAGS = fitz.TEXTFLAGS_BLOCKS & ~fitz.TEXT_PRESERVE_IMAGES
+# span flags中的粗体标志位
+_BOLD_FONT_FLAG = 1 << 4
+_DEFAULT_FONT_SIZE = 12
+
+# 页面默认以扁平文本块模式提取；开启后改用逐span的字典模式，按字号和粗体识别长文本标题
+_DEEP_PAGE_EXTRACTION = os.getenv("PDF_DEEP_EXTRACTION", "false").lower() == "true"
+
+# 前若干页中空页占比超过该阈值时视为扫描版文档，提前结束提取
+_SCANNED_MIN_PAGES = 10
+_SCANNED_EMPTY_RATIO = 0.9
+
+# 页数达到该阈值时按页码范围多进程并行提取，页数较少时进程启动开销得不偿失
+_PARALLEL_MIN_PAGES = 16
+_EXTRACT_MAX_WORKERS = 4
+# 未命中缓存的分块数超过该阈值时，分块的质量评分、关键词和摘要按批交给同一进程池（jieba为纯Python实现，线程无法并行）
+_PARALLEL_MIN_ENRICH_CHUNKS = 32
+_ENRICH_BATCH_SIZE = 50
+# 质量分数低于该值的分块被丢弃
+_MIN_CHUNK_QUALITY = 0.2
+
+# 送入递归分割器的单个片段最长为chunk_size的倍数，超过时先按固定窗口切开
+_MAX_SPLIT_SEGMENT_FACTOR = 10
+
+# 合并相邻小块时识别首尾重叠的最小长度（过短的相同前后缀视为巧合）；合并后超过chunk_size该倍数的块重新分割
+_MIN_MERGE_OVERLAP = 5
+_RESPLIT_TOLERANCE = 1.05
+
+# 正则表达式在导入时编译一次，避免热循环中反复查找re模块的内部缓存
+# 三种编号标题（"一、"、"1."、"第X章"）合并为一个分支模式，一次匹配完成
+_HEADING_RE = re.compile(r'^(?:[\d\.\s]*[一二三四五六七八九十]+[、\.]|\d+[\.\s]|第[一二三四五六七八九十\d]+[章节部分])')
+_LIST_START_RE = re.compile(r'^[\s]*[•\-\*\d+\)\(]')
+_TABLE_NUMBERS_RE = re.compile(r'\d+\s+\d+\s+\d+')
+_LIST_LINE_START_RE = re.compile(r'^[^\S\n]*[•\-\*\(\)]', re.MULTILINE)
+_QUOTE_START_RE = re.compile(r'^\s*[>\|]')
+_PAGE_MARK_RE = re.compile(r'^第\d+页')
+_PAGE_MARK_SPACED_RE = re.compile(r'^第\s*\d+\s*页')
+_PAGE_NUMBER_RE = re.compile(r'^\d+$')
+_INLINE_SPACES_RE = re.compile(r'[ \t]+')
+_SECTION_SPLIT_RE = re.compile(r'\n\s*#{1,3}\s*')
+# 固定分块得到的片段以标题开头（与_SECTION_SPLIT_RE的标题标记一致）
+_HEADING_START_RE = re.compile(r'\s*#{1,3}')
+_PARAGRAPH_SPLIT_RE = re.compile(r'\n\s*\n\s*')
+_CN_SENTENCE_END_RE = re.compile(r'[。！？]')
+# 按连续汉字串匹配，匹配次数远少于逐字匹配
+_CHINESE_RUN_RE = re.compile(r'[\u4e00-\u9fff]+')
+_SENTENCE_END_CHARS = '。！？.!?'
+
+# 文本块按类型格式化的模板（预绑定str.format，按类型查表分派）
+_BLOCK_FORMATTERS = {
+    "heading": "\n\n### {}\n".format,
+    "list": "\n{}\n".format,
+    "table": "\n【表格内容】\n{}\n".format,
+    "quote": "\n> {}\n".format,
+}
+_DEFAULT_BLOCK_FORMATTER = "\n{}\n".format
+
+# 分块关键词、摘要、质量分数按内容缓存，重复处理相同文档或重复内容时直接复用
+_CHUNK_CACHE_SIZE = int(os.getenv("CHUNK_CACHE_SIZE", "8192"))
+
+# 文档处理结果按文件内容缓存到磁盘，重复上传或重新处理相同文件时跳过提取和分块；TTL为0时关闭。
+# 缓存目录归应用所有（权限0700），不放在共享临时目录，结果以JSON保存
+_PROCESS_CACHE_DIR = os.getenv("DOC_PROCESS_CACHE_DIR") or "./data/docproc_cache"
+_PROCESS_CACHE_TTL = int(os.getenv("DOC_PROCESS_CACHE_TTL", "86400"))
+# 提取或分块逻辑变化导致输出不同时递增，使旧缓存失效
+_PROCESS_CACHE_VERSION = 3
+
+_jieba_warmed = False
+_jieba_warmup_lock = threading.Lock()
+
+def _warmup_jieba():
+    """加载jieba词典并完成一次关键词提取，避免首个分块处理时才加载造成的延迟尖峰
+    
+    不在模块导入时执行：页面提取子进程会导入本模块但不需要分词
+    """
+    global _jieba_warmed
+    if _jieba_warmed:
+        return
+    
+    with _jieba_warmup_lock:
+        if not _jieba_warmed:
+            jieba.initialize()
+            jieba.analyse.extract_tags("预热", topK=1)
+            _jieba_warmed = True
+
 class DocumentProcessor:
     """PDF文档处理器 - 增强版，支持COS存储"""
     
@@ -40,23 +133,29 @@ class DocumentProcessor:
             ]
         )
         
-        # 初始化jieba
-        jieba.initialize()
+        # 预热jieba（进程内只执行一次）
+        _warmup_jieba()
     
-    def extract_text_from_pdf(self, file_path: str) -> Dict[str, any]:
-        """从PDF文件中提取文本和元数据 - 增强版"""
+    def extract_text_from_pdf(self, source: Union[str, bytes]) -> Dict[str, any]:
+        """从PDF文件中提取文本和元数据 - 增强版
+        
+        source可以是文件路径，也可以是已读入内存的PDF字节内容（直接从内存打开，无需落盘）
+        """
         try:
             # 预检查文件
-            if not os.path.exists(file_path):
-                return {"success": False, "error": f"文件不存在: {file_path}"}
+            if isinstance(source, bytes):
+                file_size = len(source)
+            else:
+                if not os.path.exists(source):
+                    return {"success": False, "error": f"文件不存在: {source}"}
+                file_size = os.path.getsize(source)
             
-            file_size = os.path.getsize(file_path)
             if file_size == 0:
                 return {"success": False, "error": "文件为空"}
             
             # 尝试打开PDF
             try:
-                with fitz.open(file_path) as doc:
+                with _open_pdf(source) as doc:
                     # 检查文档是否可读
                     if doc.page_count == 0:
                         return {"success": False, "error": "PDF文档无页面"}
@@ -82,37 +181,69 @@ class DocumentProcessor:
                     
                     # 新增：结构化内容提取
                     structured_content = []
-                    full_text = ""
                     page_texts = []
+                    # 每页字符数以连续数组保存，统计时直接向量化求和/计数
+                    page_char_counts = np.zeros(len(doc), dtype=np.int32)
                     total_chars = 0
                     empty_pages = 0
                     
                     logger.info(f"开始处理PDF文档，共 {len(doc)} 页")
                     
+                    # 已提取的页面内容（按页码顺序），循环中未覆盖的页面再逐页提取
+                    page_contents = []
+                    extraction_mode = "sequential"
+                    if len(doc) >= _PARALLEL_MIN_PAGES:
+                        # 先顺序提取前几页探测整个文档的类型：有文本层时剩余页面并行提取，
+                        # 扫描版文档保持顺序提取，以便在下方循环中提前结束
+                        probe_count = _SCANNED_MIN_PAGES + 1
+                        page_contents = [
+                            self._extract_page_content_enhanced(doc[i], i + 1) for i in range(probe_count)
+                        ]
+                        probe_empty = sum(
+                            1 for content in page_contents if not (content["success"] and content["cleaned_text"])
+                        )
+                        if probe_empty / probe_count <= _SCANNED_EMPTY_RATIO:
+                            remaining_contents = self._extract_pages_parallel(source, probe_count, len(doc))
+                            if remaining_contents is not None:
+                                page_contents.extend(remaining_contents)
+                                extraction_mode = "parallel"
+                    
+                    metadata["extraction_mode"] = extraction_mode
+                    
                     for page_num in range(len(doc)):
-                        page = doc[page_num]
-                        
-                        # 使用增强的文本提取方法
-                        page_content = self._extract_page_content_enhanced(page, page_num + 1)
+                        if page_num < len(page_contents):
+                            page_content = page_contents[page_num]
+                        else:
+                            # 使用增强的文本提取方法
+                            page_content = self._extract_page_content_enhanced(doc[page_num], page_num + 1)
                         
-                        if page_content["success"]:
+                        cleaned_text = page_content["cleaned_text"]
+                        if page_content["success"] and cleaned_text:
+                            char_count = len(cleaned_text)
+                            # 文本块只保存在structured_content中，页面条目不再重复引用
                             structured_content.extend(page_content["blocks"])
                             page_texts.append({
                                 "page_number": page_num + 1,
-                                "text": page_content["cleaned_text"],
-                                "char_count": len(page_content["cleaned_text"]),
-                                "blocks": page_content["blocks"]
+                                "text": cleaned_text,
+                                "char_count": char_count
                             })
-                            total_chars += len(page_content["cleaned_text"])
+                            page_char_counts[page_num] = char_count
+                            total_chars += char_count
                         else:
                             empty_pages += 1
                             logger.warning(f"第{page_num + 1}页未提取到文本内容")
                             page_texts.append({
                                 "page_number": page_num + 1,
                                 "text": "",
-                                "char_count": 0,
-                                "blocks": []
+                                "char_count": 0
                             })
+                            
+                            # 扫描版文档几乎每页都为空，无需遍历剩余页面
+                            processed_pages = page_num + 1
+                            if (processed_pages > _SCANNED_MIN_PAGES and total_chars < 100 and
+                                    empty_pages / processed_pages > _SCANNED_EMPTY_RATIO):
+                                logger.warning(f"前{processed_pages}页中{empty_pages}页无文本，判定为扫描版文档，停止提取")
+                                break
                     
                     # 合并结构化内容为完整文本
                     full_text = self._merge_structured_content(structured_content)
@@ -136,6 +267,7 @@ class DocumentProcessor:
                         "metadata": metadata,
                         "full_text": full_text,
                         "page_texts": page_texts,
+                        "page_char_counts": page_char_counts,
                         "structured_content": structured_content,
                         "success": True,
                         "error": None
@@ -155,65 +287,72 @@ class DocumentProcessor:
             logger.error(f"PDF文本提取失败: {str(e)}")
             return {"success": False, "error": str(e)}
     
-    def _extract_page_content_enhanced(self, page, page_num: int) -> Dict:
-        """增强的页面内容提取"""
+    def _extract_pages_parallel(self, source: Union[str, bytes], first_page: int, page_count: int) -> Optional[List[Dict]]:
+        """多进程并行提取 [first_page, page_count) 范围的页面内容，失败时返回None由调用方顺序提取
+        
+        source为字节内容时经进程间管道传给各子进程，无需写入临时文件
+        """
+        workers = min(_EXTRACT_MAX_WORKERS, os.cpu_count() or 1)
+        if workers < 2:
+            return None
+        
+        step = -(-(page_count - first_page) // workers)
+        ranges = [(start, min(start + step, page_count)) for start in range(first_page, page_count, step)]
+        
         try:
-            # 获取结构化文本数据
-            text_dict = page.get_text("dict")
+            executor = _get_extract_pool(workers)
+            futures = [executor.submit(_extract_page_range, source, start, end) for start, end in ranges]
+            return [page_content for future in futures for page_content in future.result()]
+        except BrokenProcessPool as e:
+            # 子进程异常退出后进程池不可再用，丢弃后下次重新创建
+            logger.warning(f"页面提取进程池已损坏，改为顺序提取: {e}")
+            _reset_extract_pool()
+            return None
+        except Exception as e:
+            logger.warning(f"并行页面提取失败，改为顺序提取: {e}")
+            return None
+    
+    def _extract_page_content_enhanced(self, page, page_num: int, deep: bool = _DEEP_PAGE_EXTRACTION) -> Dict:
+        """增强的页面内容提取（deep=True时读取逐span的字体信息用于标题识别）"""
+        try:
+            # 不引用任何字体的PDF页面（如纯图片扫描页）不可能有可提取的文本，
+            # 字体列表直接来自xref资源表，远比完整的文本提取廉价
+            if page.parent.is_pdf and not page.get_fonts():
+                return {"success": False, "blocks": [], "cleaned_text": ""}
             
-            if not text_dict or "blocks" not in text_dict:
+            if deep:
+                raw_blocks = self._read_page_blocks_deep(page)
+            else:
+                raw_blocks = self._read_page_blocks_fast(page)
+            
+            if raw_blocks is None:
                 return {"success": False, "blocks": [], "cleaned_text": ""}
             
             content_blocks = []
             page_text_parts = []
             
-            for block in text_dict["blocks"]:
-                if "lines" not in block:
-                    continue
+            for block_text, avg_font_size, is_bold, bbox in raw_blocks:
+                # 分析文本块类型
+                block_type = self._classify_text_block(
+                    block_text, 
+                    avg_font_size, 
+                    is_bold,
+                    bbox
+                )
                 
-                block_text = ""
-                font_sizes = []
-                is_bold = False
+                # 字号、粗体和位置只用于分类，不随文本块保留，减小结构化内容的体积
+                block_info = {
+                    "page": page_num,
+                    "type": block_type,
+                    "text": block_text
+                }
                 
-                for line in block["lines"]:
-                    line_text = ""
-                    for span in line.get("spans", []):
-                        text = span.get("text", "").strip()
-                        if text:
-                            line_text += text + " "
-                            font_sizes.append(span.get("size", 12))
-                            # 检查是否为粗体
-                            font_flags = span.get("flags", 0)
-                            if font_flags & 2**4:  # 粗体标志
-                                is_bold = True
-                    
-                    if line_text.strip():
-                        block_text += line_text.strip() + "\n"
+                # 根据类型格式化文本，结果随文本块保存，合并全文时直接复用
+                formatted_text = self._format_block_text(block_info)
+                block_info["formatted_text"] = formatted_text
                 
-                if block_text.strip():
-                    # 分析文本块类型
-                    avg_font_size = np.mean(font_sizes) if font_sizes else 12
-                    block_type = self._classify_text_block(
-                        block_text.strip(), 
-                        avg_font_size, 
-                        is_bold,
-                        block.get("bbox", [0, 0, 0, 0])
-                    )
-                    
-                    block_info = {
-                        "page": page_num,
-                        "type": block_type,
-                        "text": block_text.strip(),
-                        "font_size": avg_font_size,
-                        "is_bold": is_bold,
-                        "bbox": block.get("bbox", [])
-                    }
-                    
-                    content_blocks.append(block_info)
-                    
-                    # 根据类型格式化文本
-                    formatted_text = self._format_block_text(block_info)
-                    page_text_parts.append(formatted_text)
+                content_blocks.append(block_info)
+                page_text_parts.append(formatted_text)
             
             # 合并页面文本
             cleaned_text = self._clean_page_text("\n".join(page_text_parts))
@@ -228,6 +367,62 @@ class DocumentProcessor:
             logger.error(f"页面内容提取失败: {e}")
             return {"success": False, "blocks": [], "cleaned_text": ""}
     
+    def _read_page_blocks_fast(self, page) -> Optional[List[Tuple]]:
+        """以扁平元组模式读取文本块，不构造逐span的字典
+        
+        不读取字体信息：短文本块无论字体都会被识别为标题，
+        字号和粗体只影响长文本块的标题判定
+        """
+        raw_blocks = []
+        for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks", flags=_PAGE_BLOCKS_FLAGS):
+            if block_type != 0:
+                continue
+            
+            lines = [line for line in (line.strip() for line in text.split("\n")) if line]
+            if lines:
+                raw_blocks.append(("\n".join(lines), _DEFAULT_FONT_SIZE, False, (x0, y0, x1, y1)))
+        
+        return raw_blocks
+    
+    def _read_page_blocks_deep(self, page) -> Optional[List[Tuple]]:
+        """以结构化字典模式读取文本块，附带平均字号和粗体信息"""
+        text_dict = page.get_text("dict", flags=_PAGE_DICT_FLAGS)
+        
+        if not text_dict or "blocks" not in text_dict:
+            return None
+        
+        raw_blocks = []
+        for block in text_dict["blocks"]:
+            if "lines" not in block:
+                continue
+            
+            # 收集片段后一次性拼接，避免逐段 += 产生的重复复制
+            line_texts = []
+            font_size_sum = 0.0
+            font_size_count = 0
+            is_bold = False
+            
+            for line in block["lines"]:
+                span_texts = []
+                for span in line.get("spans", []):
+                    text = span.get("text", "").strip()
+                    if text:
+                        span_texts.append(text)
+                        font_size_sum += span.get("size", _DEFAULT_FONT_SIZE)
+                        font_size_count += 1
+                        # 检查是否为粗体
+                        if span.get("flags", 0) & _BOLD_FONT_FLAG:
+                            is_bold = True
+                
+                if span_texts:
+                    line_texts.append(" ".join(span_texts))
+            
+            if line_texts:
+                avg_font_size = font_size_sum / font_size_count if font_size_count else _DEFAULT_FONT_SIZE
+                raw_blocks.append(("\n".join(line_texts), avg_font_size, is_bold, block.get("bbox", (0, 0, 0, 0))))
+        
+        return raw_blocks
+    
     def _classify_text_block(self, text: str, font_size: float, is_bold: bool, bbox: List) -> str:
         """分类文本块类型"""
         text_clean = text.strip()
@@ -235,47 +430,33 @@ class DocumentProcessor:
         # 标题检测
         if (font_size > 14 or is_bold or 
             len(text_clean) < 100 or 
-            re.match(r'^[\d\.\s]*[一二三四五六七八九十]+[、\.]', text_clean) or
-            re.match(r'^\d+[\.\s]', text_clean) or
-            re.match(r'^第[一二三四五六七八九十\d]+[章节部分]', text_clean)):
+            _HEADING_RE.match(text_clean)):
             return "heading"
         
-        # 列表检测
-        if (re.match(r'^[\s]*[•\-\*\d+\)\(]', text_clean) or
-            '•' in text_clean or 
-            text_clean.count('\n') > 2 and 
-            any(line.strip().startswith(('•', '-', '*', '(', ')')) for line in text_clean.split('\n'))):
+        # 列表检测（先做子串判断，多行时用一次多行匹配代替逐行切分）
+        if ('•' in text_clean or
+            _LIST_START_RE.match(text_clean) or
+            text_clean.count('\n') > 2 and _LIST_LINE_START_RE.search(text_clean)):
             return "list"
         
         # 表格检测
         if ('\t' in text_clean or 
             text_clean.count('|') > 2 or
-            re.search(r'\d+\s+\d+\s+\d+', text_clean)):
+            _TABLE_NUMBERS_RE.search(text_clean)):
             return "table"
         
         # 引用或代码检测
         if (text_clean.startswith('"') and text_clean.endswith('"') or
             text_clean.count('```') >= 2 or
-            re.match(r'^\s*[>\|]', text_clean)):
+            _QUOTE_START_RE.match(text_clean)):
             return "quote"
         
         return "paragraph"
     
     def _format_block_text(self, block_info: Dict) -> str:
         """根据块类型格式化文本"""
-        text = block_info["text"]
-        block_type = block_info["type"]
-        
-        if block_type == "heading":
-            return f"\n\n### {text}\n"
-        elif block_type == "list":
-            return f"\n{text}\n"
-        elif block_type == "table":
-            return f"\n【表格内容】\n{text}\n"
-        elif block_type == "quote":
-            return f"\n> {text}\n"
-        else:
-            return f"\n{text}\n"
+        formatter = _BLOCK_FORMATTERS.get(block_info["type"], _DEFAULT_BLOCK_FORMATTER)
+        return formatter(block_info["text"])
     
     def _merge_structured_content(self, structured_content: List[Dict]) -> str:
         """合并结构化内容"""
@@ -283,10 +464,10 @@ class DocumentProcessor:
         current_section = ""
         
         for block in structured_content:
-            formatted_text = self._format_block_text(block)
+            formatted_text = block.get("formatted_text") or self._format_block_text(block)
             
             # 避免重复的页码标识
-            if not re.match(r'^第\d+页', formatted_text.strip()):
+            if not _PAGE_MARK_RE.match(formatted_text.strip()):
                 merged_parts.append(formatted_text)
         
         full_text = "".join(merged_parts)
@@ -294,39 +475,23 @@ class DocumentProcessor:
     
     def _clean_page_text(self, text: str) -> str:
         """清理页面文本"""
-        # 移除多余空白
-        text = re.sub(r'\s+', ' ', text)
-        
-        # 修复断行问题
-        text = re.sub(r'([a-zA-Z\u4e00-\u9fff])-\s*\n\s*([a-zA-Z\u4e00-\u9fff])', r'\1\2', text)
-        
-        # 移除页码等
-        lines = text.split('\n')
-        cleaned_lines = []
-        
-        for line in lines:
-            line = line.strip()
-            # 跳过纯数字页码、过短内容
-            if (re.match(r'^\d+$', line) or 
-                len(line) < 3 or
-                re.match(r'^第\s*\d+\s*页', line) or
-                line in ['', ' ']):
-                continue
-            cleaned_lines.append(line)
+        # 移除多余空白：所有空白（包括换行）折叠为单个空格，页面文本只剩一行，
+        # 因此断行修复和逐行过滤等价于对整页文本做一次判断
+        text = " ".join(text.split())
+        
+        # 跳过纯数字页码、页码标识、过短内容
+        if (len(text) < 3 or
+            _PAGE_NUMBER_RE.match(text) or
+            _PAGE_MARK_SPACED_RE.match(text)):
+            return ""
         
-        return '\n'.join(cleaned_lines)
+        return text
     
     def _final_text_cleanup(self, text: str) -> str:
         """最终文本清理"""
-        # 规范化换行
-        text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)
-        # 规范化空格
-        text = re.sub(r'[ \t]+', ' ', text)
-        # 移除行首行尾空格
-        lines = [line.strip() for line in text.split('\n')]
-        text = '\n'.join(line for line in lines if line)
-        
-        return text.strip()
+        # 规范化空格后逐行去除首尾空白并丢弃空行（多余空行随之消除，无需单独规范化换行）
+        text = _INLINE_SPACES_RE.sub(' ', text)
+        return '\n'.join(line for line in map(str.strip, text.split('\n')) if line)
 
     def split_text_into_chunks(self, text: str) -> List[Dict[str, any]]:
         """智能文本分块 - 优化版（降低过滤阈值）"""
@@ -340,40 +505,35 @@ class DocumentProcessor:
             
             # 2. 处理和增强分块
             processed_chunks = []
-            skipped_short = 0
             skipped_low_quality = 0
             
-            for i, chunk in enumerate(chunks):
-                chunk_content = chunk.strip()
-                
-                # 降低最小长度阈值：从50降到20
-                if len(chunk_content) < 20:
-                    skipped_short += 1
-                    logger.debug(f"跳过过短的文本块 {i}: {chunk_content[:30]}")
-                    continue
-                
-                # 计算文本质量分数
-                quality_score = self._calculate_text_quality(chunk_content)
-                
+            # 降低最小长度阈值：从50降到20
+            stripped_chunks = [(i, chunk.strip()) for i, chunk in enumerate(chunks)]
+            kept_chunks = [(i, content) for i, content in stripped_chunks if len(content) >= 20]
+            skipped_short = len(stripped_chunks) - len(kept_chunks)
+            
+            # 质量分数、关键词和摘要对各分块独立计算，分块较多时分批多进程执行
+            enrichments = self._enrich_chunks([content for _, content in kept_chunks])
+            
+            for (i, chunk_content), (quality_score, keywords, summary) in zip(kept_chunks, enrichments):
                 # 降低质量阈值：从默认过滤改为只过滤极低质量的内容
-                if quality_score < 0.2:
+                if quality_score < _MIN_CHUNK_QUALITY:
                     skipped_low_quality += 1
                     logger.debug(f"跳过低质量文本块 {i}: 质量分数={quality_score:.3f}")
                     continue
                 
-                # 生成块的唯一ID
-                chunk_id = hashlib.md5(f"{chunk}_{i}".encode()).hexdigest()
-                
-                # 提取关键词和生成摘要
-                keywords = self._extract_chunk_keywords(chunk_content)
-                summary = self._generate_chunk_summary(chunk_content)
+                # 生成块的唯一ID：以块序号作为盐值，避免为哈希拼接整块文本；
+                # 保持16字节摘要（32位十六进制），Qdrant可将其解析为UUID作为点ID
+                chunk_id = hashlib.blake2b(
+                    chunk_content.encode('utf-8'), digest_size=16, salt=i.to_bytes(16, 'little')
+                ).hexdigest()
                 
                 chunk_data = {
                     "chunk_id": chunk_id,
                     "content": chunk_content,
                     "chunk_index": len(processed_chunks),
                     "chunk_length": len(chunk_content),
-                    "keywords": keywords,
+                    "keywords": list(keywords),
                     "summary": summary,
                     "quality_score": quality_score
                 }
@@ -389,7 +549,8 @@ class DocumentProcessor:
 
     def _balanced_chunking(self, text: str) -> List[str]:
         """平衡的分块策略 - 结合语义分块和固定分块"""
-        chunks = []
+        # 片段记为（章节序号, 分割来源序号, 文本）：同一来源的片段由分割器切出，相邻片段之间带有分割重叠
+        pieces = []
         
         # 首先尝试语义分块
         semantic_chunks = self._semantic_chunking(text)
@@ -397,31 +558,103 @@ class DocumentProcessor:
         # 如果语义分块产生的块太多或太小，降级到固定分块
         if len(semantic_chunks) > len(text) / 200:  # 平均每块小于200字符
             logger.info("语义分块产生过多小块，使用固定分块策略")
-            chunks = self.text_splitter.split_text(text)
+            section_id = 0
+            for chunk in self.text_splitter.split_text(text):
+                # 以标题开头的片段开始新章节
+                if pieces and _HEADING_START_RE.match(chunk):
+                    section_id += 1
+                pieces.append((section_id, 0, chunk))
         else:
             # 对过长的语义块进行进一步分割
-            for chunk in semantic_chunks:
+            for block_id, (section_id, chunk) in enumerate(semantic_chunks):
                 if len(chunk) <= self.chunk_size:
-                    chunks.append(chunk)
+                    pieces.append((section_id, block_id, chunk))
+                elif len(chunk) > self.chunk_size * _MAX_SPLIT_SEGMENT_FACTOR:
+                    # 超长且缺少分隔符的片段会让递归分割器反复细分，先按固定窗口切开限制单次输入长度
+                    for window in self._slice_into_windows(chunk, self.chunk_size * _MAX_SPLIT_SEGMENT_FACTOR):
+                        pieces.extend(
+                            (section_id, block_id, sub_chunk) for sub_chunk in self.text_splitter.split_text(window)
+                        )
                 else:
-                    sub_chunks = self.text_splitter.split_text(chunk)
-                    chunks.extend(sub_chunks)
+                    pieces.extend((section_id, block_id, sub_chunk) for sub_chunk in self.text_splitter.split_text(chunk))
         
-        return chunks
+        # 第二遍：合并相邻的小块，减少过短分块和下游向量化调用次数
+        return self._merge_small_chunks(pieces)
+    
+    def _merge_small_chunks(self, pieces: List[Tuple[int, int, str]]) -> List[str]:
+        """从左到右合并同一章节内的相邻片段，合并后不超过chunk_size；仍然超长的块重新分割。
+        只在同一分割来源的相邻片段之间去除分割重叠，不同来源的片段原样拼接"""
+        merged = []
+        current = ""
+        current_section = current_block = None
+        
+        for section_id, block_id, chunk in pieces:
+            chunk = chunk.strip()
+            if not chunk:
+                continue
+            
+            if not current or section_id != current_section:
+                # 不跨越标题合并
+                if current:
+                    merged.append(current)
+                current, current_section, current_block = chunk, section_id, block_id
+                continue
+            
+            # 分割器切出的相邻片段首尾有重叠，合并时去掉重复部分
+            overlap = self._chunk_overlap_length(current, chunk) if block_id == current_block else 0
+            if overlap:
+                candidate = current + chunk[overlap:]
+            else:
+                candidate = current + "\n\n" + chunk
+            
+            if len(candidate) <= self.chunk_size:
+                current = candidate
+            else:
+                merged.append(current)
+                current = chunk
+            current_block = block_id
+        
+        if current:
+            merged.append(current)
+        
+        resplit_limit = self.chunk_size * _RESPLIT_TOLERANCE
+        if any(len(chunk) > resplit_limit for chunk in merged):
+            resplit = []
+            for chunk in merged:
+                if len(chunk) > resplit_limit:
+                    resplit.extend(self.text_splitter.split_text(chunk))
+                else:
+                    resplit.append(chunk)
+            merged = resplit
+        
+        return merged
+    
+    def _chunk_overlap_length(self, previous: str, following: str) -> int:
+        """返回previous末尾与following开头重叠的字符数（不足最小重叠长度时视为无重叠）"""
+        max_overlap = min(self.chunk_overlap, len(previous), len(following))
+        for length in range(max_overlap, _MIN_MERGE_OVERLAP - 1, -1):
+            if following.startswith(previous[-length:]):
+                return length
+        return 0
+    
+    def _slice_into_windows(self, text: str, window_size: int) -> List[str]:
+        """按固定长度切分文本，相邻窗口保留chunk_overlap个字符的重叠"""
+        step = max(window_size - self.chunk_overlap, 1)
+        return [text[start:start + window_size] for start in range(0, len(text) - self.chunk_overlap, step)]
 
-    def _semantic_chunking(self, text: str) -> List[str]:
-        """优化的语义分块"""
+    def _semantic_chunking(self, text: str) -> List[Tuple[int, str]]:
+        """优化的语义分块，返回（章节序号, 分块文本）"""
         chunks = []
         
         # 按标题分段（更宽松的标题识别）
-        sections = re.split(r'\n\s*#{1,3}\s*', text)  # 支持多级标题
+        sections = _SECTION_SPLIT_RE.split(text)  # 支持多级标题
         
-        for section in sections:
+        for section_id, section in enumerate(sections):
             if not section.strip():
                 continue
             
             # 每个section按段落进一步分割
-            paragraphs = re.split(r'\n\s*\n\s*', section)
+            paragraphs = _PARAGRAPH_SPLIT_RE.split(section)
             
             current_chunk = ""
             
@@ -436,87 +669,68 @@ class DocumentProcessor:
                 # 如果超过最大长度，保存当前块并开始新块
                 if len(potential_chunk) > self.chunk_size * 1.2:  # 允许20%的超出
                     if current_chunk:
-                        chunks.append(current_chunk.strip())
+                        chunks.append((section_id, current_chunk.strip()))
                     current_chunk = para
                 else:
                     current_chunk = potential_chunk
             
             # 保存最后一个块
             if current_chunk.strip():
-                chunks.append(current_chunk.strip())
+                chunks.append((section_id, current_chunk.strip()))
         
         return chunks
     
     def _extract_chunk_keywords(self, text: str) -> List[str]:
         """提取文本块关键词"""
-        try:
-            # 使用jieba提取关键词
-            keywords = jieba.analyse.extract_tags(text, topK=8, withWeight=False)
-            return keywords
-        except Exception as e:
-            logger.warning(f"关键词提取失败: {e}")
-            return []
+        return list(_cached_chunk_keywords(text))
+    
+    def _enrich_chunks(self, texts: List[str]) -> List[Tuple[float, Tuple[str, ...], str]]:
+        """计算各分块的（质量分数, 关键词, 摘要）
+        
+        命中关键词缓存的分块在主进程直接计算；未命中的数量较多时分批交给进程池，
+        结果回填缓存，避免命中缓存的分块也往返序列化
+        """
+        results = [None] * len(texts)
+        missing = []
+        for i, text in enumerate(texts):
+            keywords = _get_cached_keywords(text)
+            if keywords is None:
+                missing.append(i)
+            else:
+                results[i] = (_cached_text_quality(text), keywords, _cached_chunk_summary(text))
+        
+        workers = min(_EXTRACT_MAX_WORKERS, os.cpu_count() or 1)
+        if len(missing) > _PARALLEL_MIN_ENRICH_CHUNKS and workers >= 2:
+            missing_texts = [texts[i] for i in missing]
+            batches = [
+                missing_texts[start:start + _ENRICH_BATCH_SIZE]
+                for start in range(0, len(missing_texts), _ENRICH_BATCH_SIZE)
+            ]
+            try:
+                executor = _get_extract_pool(workers)
+                enriched = [item for batch in executor.map(_enrich_chunk_range, batches) for item in batch]
+                for i, item in zip(missing, enriched):
+                    results[i] = item
+                    if item[0] >= _MIN_CHUNK_QUALITY:
+                        _put_cached_keywords(texts[i], item[1])
+                return results
+            except BrokenProcessPool as e:
+                logger.warning(f"分块处理进程池已损坏，改为顺序处理: {e}")
+                _reset_extract_pool()
+            except Exception as e:
+                logger.warning(f"并行分块处理失败，改为顺序处理: {e}")
+        
+        for i in missing:
+            results[i] = _enrich_chunk(texts[i], _cached_chunk_keywords)
+        return results
     
     def _generate_chunk_summary(self, text: str) -> str:
         """生成文本块摘要"""
-        try:
-            # 提取第一个完整句子作为摘要
-            sentences = re.split(r'[。！？]', text)
-            if sentences and sentences[0].strip():
-                summary = sentences[0].strip()
-                return summary[:100] + "..." if len(summary) > 100 else summary
-            
-            # 如果没有句子，返回前100个字符
-            return text[:100] + "..." if len(text) > 100 else text
-            
-        except Exception as e:
-            logger.warning(f"摘要生成失败: {e}")
-            return text[:50] + "..." if len(text) > 50 else text
+        return _cached_chunk_summary(text)
     
     def _calculate_text_quality(self, text: str) -> float:
         """优化的文本质量分数计算"""
-        try:
-            score = 0.5  # 基础分数从1.0降到0.5，更宽松
-            
-            # 长度评分（更宽松）
-            text_len = len(text)
-            if text_len >= 30:  # 降低最小长度要求
-                if text_len < 100:
-                    score += 0.2
-                elif text_len <= 800:
-                    score += 0.3
-                elif text_len <= 1500:
-                    score += 0.2
-                else:
-                    score += 0.1
-            
-            # 中文字符比例（更宽松）
-            chinese_chars = len(re.findall(r'[\u4e00-\u9fff]', text))
-            if text:
-                chinese_ratio = chinese_chars / len(text)
-                if chinese_ratio >= 0.1:  # 从0.3降到0.1
-                    score += 0.2
-            
-            # 信息密度（更宽松）
-            if text:
-                char_diversity = len(set(text)) / len(text)
-                if char_diversity >= 0.05:  # 从0.1降到0.05
-                    score += 0.2
-            
-            # 结构完整性（更宽松）
-            complete_sentences = len(re.findall(r'[。！？.!?]', text))
-            if complete_sentences > 0 or len(text) <= 50:  # 短文本不要求完整句子
-                score += 0.1
-            
-            # 特殊内容识别（加分项）
-            if any(keyword in text for keyword in ['表', '图', '公式', '定义', '定理', '结论']):
-                score += 0.1
-            
-            return min(max(score, 0.1), 1.0)
-            
-        except Exception as e:
-            logger.warning(f"质量分数计算失败: {e}")
-            return 0.5
+        return _cached_text_quality(text)
 
     def process_document(self, document_id: str, storage_type: str, file_path: str, cos_object_key: str = None) -> Dict[str, any]:
         try:
@@ -539,55 +753,41 @@ class DocumentProcessor:
             if not file_content.startswith(b'%PDF-'):
                 return {"success": False, "error": "文件不是有效的PDF格式"}
             
-            # 创建临时文件时确保完全写入
-            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-                temp_file.write(file_content)
-                temp_file.flush()  # 确保数据写入磁盘
-                os.fsync(temp_file.fileno())  # 强制同步到磁盘
-                temp_file_path = temp_file.name
+            # 相同文件内容在相同处理参数下的结果一致，命中缓存时直接返回
+            cache_key = self._process_cache_key(file_content)
+            cached_result = self._load_processed_result(cache_key)
+            if cached_result is not None:
+                logger.info(f"文档 {document_id} 命中处理结果缓存，跳过提取和分块")
+                return cached_result
             
-            # 验证临时文件
-            if not os.path.exists(temp_file_path):
-                return {"success": False, "error": "临时文件创建失败"}
+            # 直接从内存中的文件内容提取文本，无需写入临时文件
+            extraction_result = self.extract_text_from_pdf(file_content)
             
-            temp_file_size = os.path.getsize(temp_file_path)
-            if temp_file_size != len(file_content):
-                return {"success": False, "error": f"临时文件大小不匹配：期望{len(file_content)}，实际{temp_file_size}"}
+            if not extraction_result["success"]:
+                return extraction_result
+            
+            # 智能分块
+            chunks = self.split_text_into_chunks(extraction_result["full_text"])
+            
+            # 计算处理质量指标
+            quality_metrics = self._calculate_processing_quality(
+                extraction_result, chunks
+            )
+            
+            result = {
+                "metadata": extraction_result["metadata"],
+                "full_text": extraction_result["full_text"],
+                "page_texts": extraction_result["page_texts"],
+                "structured_content": extraction_result.get("structured_content", []),
+                "chunks": chunks,
+                "chunk_count": len(chunks),
+                "quality_metrics": quality_metrics,
+                "success": True,
+                "error": None
+            }
+            self._save_processed_result(cache_key, result)
+            return result
             
-            try:
-                # 提取文本
-                extraction_result = self.extract_text_from_pdf(temp_file_path)
-                
-                if not extraction_result["success"]:
-                    return extraction_result
-                
-                # 智能分块
-                chunks = self.split_text_into_chunks(extraction_result["full_text"])
-                
-                # 计算处理质量指标
-                quality_metrics = self._calculate_processing_quality(
-                    extraction_result, chunks
-                )
-                
-                return {
-                    "metadata": extraction_result["metadata"],
-                    "full_text": extraction_result["full_text"],
-                    "page_texts": extraction_result["page_texts"],
-                    "structured_content": extraction_result.get("structured_content", []),
-                    "chunks": chunks,
-                    "chunk_count": len(chunks),
-                    "quality_metrics": quality_metrics,
-                    "success": True,
-                    "error": None
-                }
-                
-            finally:
-                # 清理临时文件
-                try:
-                    os.unlink(temp_file_path)
-                except:
-                    pass
-                    
         except Exception as e:
             logger.error(f"文档处理失败: {str(e)}")
             return {
@@ -595,16 +795,101 @@ class DocumentProcessor:
                 "error": str(e)
             }
     
+    def _process_cache_key(self, file_content: bytes) -> str:
+        """处理结果缓存键：文件内容哈希 + 所有影响输出的处理参数"""
+        content_hash = hashlib.sha1(file_content).hexdigest()
+        return (
+            f"{content_hash}_{self.chunk_size}_{self.chunk_overlap}"
+            f"_{int(_DEEP_PAGE_EXTRACTION)}_v{_PROCESS_CACHE_VERSION}"
+        )
+    
+    @staticmethod
+    def _process_cache_dir_usable(create: bool) -> bool:
+        """缓存目录必须归当前用户所有且其他用户不可写，否则不读写缓存（create为True时按0700权限创建）"""
+        if create:
+            os.makedirs(_PROCESS_CACHE_DIR, mode=0o700, exist_ok=True)
+        try:
+            dir_stat = os.stat(_PROCESS_CACHE_DIR)
+        except FileNotFoundError:
+            return False
+        
+        if hasattr(os, "getuid") and dir_stat.st_uid != os.getuid():
+            logger.warning(f"处理结果缓存目录不属于当前用户，已停用缓存: {_PROCESS_CACHE_DIR}")
+            return False
+        if dir_stat.st_mode & 0o022:
+            logger.warning(f"处理结果缓存目录可被其他用户写入，已停用缓存: {_PROCESS_CACHE_DIR}")
+            return False
+        return True
+    
+    def _load_processed_result(self, cache_key: str) -> Optional[Dict]:
+        """读取未过期的处理结果缓存，过期或损坏的缓存文件直接删除"""
+        if _PROCESS_CACHE_TTL <= 0 or not self._process_cache_dir_usable(create=False):
+            return None
+        
+        cache_path = os.path.join(_PROCESS_CACHE_DIR, f"{cache_key}.json")
+        try:
+            if time.time() - os.path.getmtime(cache_path) > _PROCESS_CACHE_TTL:
+                os.unlink(cache_path)
+                return None
+            
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"处理结果缓存读取失败，重新处理: {e}")
+            try:
+                os.unlink(cache_path)
+            except OSError:
+                pass
+            return None
+    
+    def _save_processed_result(self, cache_key: str, result: Dict):
+        """写入处理结果缓存（先写临时文件再原子替换），并顺带清理过期的缓存文件"""
+        if _PROCESS_CACHE_TTL <= 0:
+            return
+        
+        try:
+            if not self._process_cache_dir_usable(create=True):
+                return
+            cache_path = os.path.join(_PROCESS_CACHE_DIR, f"{cache_key}.json")
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False)
+            os.replace(tmp_path, cache_path)
+            
+            expire_before = time.time() - _PROCESS_CACHE_TTL
+            with os.scandir(_PROCESS_CACHE_DIR) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".json") and entry.stat().st_mtime < expire_before:
+                        os.unlink(entry.path)
+        except Exception as e:
+            logger.warning(f"处理结果缓存写入失败: {e}")
+    
     def _calculate_processing_quality(self, extraction_result: Dict, chunks: List[Dict]) -> Dict:
         """计算处理质量指标"""
         try:
+            page_char_counts = extraction_result.get("page_char_counts")
+            if page_char_counts is None:
+                page_char_counts = np.fromiter(
+                    (page["char_count"] for page in extraction_result["page_texts"]), dtype=np.int32
+                )
+            
+            # 分块通常只有几十到几百个，单次遍历累加比构造numpy数组求均值更快
+            total_chunk_length = 0
+            total_quality_score = 0.0
+            for chunk in chunks:
+                total_chunk_length += chunk["chunk_length"]
+                total_quality_score += chunk.get("quality_score", 0.5)
+            chunk_count = len(chunks)
+            
             metrics = {
                 "total_text_length": len(extraction_result["full_text"]),
-                "valid_pages": sum(1 for page in extraction_result["page_texts"] if page["char_count"] > 0),
-                "total_pages": len(extraction_result["page_texts"]),
-                "chunk_count": len(chunks),
-                "avg_chunk_length": np.mean([chunk["chunk_length"] for chunk in chunks]) if chunks else 0,
-                "avg_quality_score": np.mean([chunk.get("quality_score", 0.5) for chunk in chunks]) if chunks else 0,
+                "valid_pages": int(np.count_nonzero(page_char_counts)),
+                "total_pages": len(page_char_counts),
+                "chunk_count": chunk_count,
+                "avg_chunk_length": total_chunk_length / chunk_count if chunk_count else 0,
+                "avg_quality_score": total_quality_score / chunk_count if chunk_count else 0,
                 "keywords_coverage": len(set(kw for chunk in chunks for kw in chunk.get("keywords", [])))
             }
             
@@ -625,4 +910,146 @@ class DocumentProcessor:
             
         except Exception as e:
             logger.warning(f"质量指标计算失败: {e}")
-            return {"overall_quality": 0.5} 
\ No newline at end of file
+            return {"overall_quality": 0.5} 
+
+# 关键词缓存需要在批量提取前查询命中情况并回填并行结果，因此使用显式的LRU字典而非lru_cache
+_chunk_keyword_cache: "OrderedDict[str, Tuple[str, ...]]" = OrderedDict()
+_chunk_keyword_cache_lock = threading.Lock()
+
+def _get_cached_keywords(text: str) -> Optional[Tuple[str, ...]]:
+    """查询关键词缓存，未命中返回None"""
+    with _chunk_keyword_cache_lock:
+        keywords = _chunk_keyword_cache.get(text)
+        if keywords is not None:
+            _chunk_keyword_cache.move_to_end(text)
+        return keywords
+
+def _put_cached_keywords(text: str, keywords: Tuple[str, ...]):
+    """写入关键词缓存，超出容量时淘汰最久未使用的条目"""
+    with _chunk_keyword_cache_lock:
+        _chunk_keyword_cache[text] = keywords
+        _chunk_keyword_cache.move_to_end(text)
+        if len(_chunk_keyword_cache) > _CHUNK_CACHE_SIZE:
+            _chunk_keyword_cache.popitem(last=False)
+
+def _extract_keywords(text: str) -> Tuple[str, ...]:
+    """使用jieba提取文本块关键词"""
+    try:
+        return tuple(jieba.analyse.extract_tags(text, topK=8, withWeight=False))
+    except Exception as e:
+        logger.warning(f"关键词提取失败: {e}")
+        return ()
+
+def _enrich_chunk(text: str, extract_keywords=_extract_keywords) -> Tuple[float, Tuple[str, ...], str]:
+    """计算单个分块的（质量分数, 关键词, 摘要），低质量分块不提取关键词和摘要"""
+    quality_score = _cached_text_quality(text)
+    if quality_score < _MIN_CHUNK_QUALITY:
+        return quality_score, (), ""
+    return quality_score, extract_keywords(text), _cached_chunk_summary(text)
+
+def _enrich_chunk_range(texts: List[str]) -> List[Tuple[float, Tuple[str, ...], str]]:
+    """在子进程中处理一批分块"""
+    return [_enrich_chunk(text) for text in texts]
+
+def _cached_chunk_keywords(text: str) -> Tuple[str, ...]:
+    """提取文本块关键词（返回不可变元组，供多次调用共享）"""
+    keywords = _get_cached_keywords(text)
+    if keywords is None:
+        keywords = _extract_keywords(text)
+        _put_cached_keywords(text, keywords)
+    return keywords
+
+@functools.lru_cache(maxsize=_CHUNK_CACHE_SIZE)
+def _cached_chunk_summary(text: str) -> str:
+    """生成文本块摘要"""
+    try:
+        # 提取第一个完整句子作为摘要（只定位第一个句末标点，不切分整块文本）
+        match = _CN_SENTENCE_END_RE.search(text)
+        summary = (text[:match.start()] if match else text).strip()
+        if summary:
+            return summary[:100] + "..." if len(summary) > 100 else summary
+        
+        # 如果没有句子，返回前100个字符
+        return text[:100] + "..." if len(text) > 100 else text
+        
+    except Exception as e:
+        logger.warning(f"摘要生成失败: {e}")
+        return text[:50] + "..." if len(text) > 50 else text
+
+@functools.lru_cache(maxsize=_CHUNK_CACHE_SIZE)
+def _cached_text_quality(text: str) -> float:
+    """优化的文本质量分数计算"""
+    try:
+        score = 0.5  # 基础分数从1.0降到0.5，更宽松
+        
+        # 长度评分（更宽松）
+        text_len = len(text)
+        if text_len >= 30:  # 降低最小长度要求
+            if text_len < 100:
+                score += 0.2
+            elif text_len <= 800:
+                score += 0.3
+            elif text_len <= 1500:
+                score += 0.2
+            else:
+                score += 0.1
+        
+        if text_len:
+            # 中文字符比例（更宽松）
+            chinese_chars = sum(map(len, _CHINESE_RUN_RE.findall(text)))
+            chinese_ratio = chinese_chars / text_len
+            if chinese_ratio >= 0.1:  # 从0.3降到0.1
+                score += 0.2
+            
+            # 信息密度（更宽松）
+            char_diversity = len(set(text)) / text_len
+            if char_diversity >= 0.05:  # 从0.1降到0.05
+                score += 0.2
+        
+        # 结构完整性（更宽松）
+        has_complete_sentence = any(ch in text for ch in _SENTENCE_END_CHARS)
+        if has_complete_sentence or text_len <= 50:  # 短文本不要求完整句子
+            score += 0.1
+        
+        # 特殊内容识别（加分项）
+        if any(keyword in text for keyword in ['表', '图', '公式', '定义', '定理', '结论']):
+            score += 0.1
+        
+        return min(max(score, 0.1), 1.0)
+        
+    except Exception as e:
+        logger.warning(f"质量分数计算失败: {e}")
+        return 0.5
+
+# 页面提取进程池在首次使用时创建并在文档间复用，避免每个文档都重新启动子进程
+_extract_pool: Optional[ProcessPoolExecutor] = None
+_extract_pool_lock = threading.Lock()
+
+def _get_extract_pool(workers: int) -> ProcessPoolExecutor:
+    """获取共享的页面提取进程池"""
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            _extract_pool = ProcessPoolExecutor(max_workers=workers)
+        return _extract_pool
+
+def _reset_extract_pool():
+    """丢弃已损坏的进程池"""
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is not None:
+            _extract_pool.shutdown(wait=False)
+            _extract_pool = None
+
+def _open_pdf(source: Union[str, bytes]) -> fitz.Document:
+    """按路径或内存中的字节内容打开PDF文档"""
+    if isinstance(source, bytes):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+def _extract_page_range(source: Union[str, bytes], start: int, end: int) -> List[Dict]:
+    """在子进程中提取指定页码范围的内容（PyMuPDF文档对象不能跨进程/线程共享，需各自打开）"""
+    # 页面提取不依赖实例状态，跳过__init__以避免在每个子进程中初始化jieba
+    processor = DocumentProcessor.__new__(DocumentProcessor)
+    with _open_pdf(source) as doc:
+        return [processor._extract_page_content_enhanced(doc[i], i + 1) for i in range(start, end)]
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from typing import Dict, List, Tuple
+from langchain.embeddings.base import Embeddings
+
+logger = logging.getLogger(__name__)
+
+class QueryEmbeddingBatcher:
+    """查询向量微批处理器 - 将并发请求的查询合并为一次embed_documents调用"""
+
+    def __init__(self, embeddings: Embeddings, max_batch: int = 10, max_wait_ms: int = 20):
+        self.embeddings = embeddings
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+
+        # 等待合并的查询：(查询文本, 对应的future)
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle = None
+
+    async def embed_query(self, text: str) -> List[float]:
+        """提交查询并等待所在批次的向量结果"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        """取出当前批次并提交嵌入任务"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._embed_batch(batch))
+
+    async def _embed_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        """对批次内去重后的查询统一嵌入，并把结果分发给各请求"""
+        texts = list(dict.fromkeys(text for text, _ in batch))
+
+        try:
+            loop = asyncio.get_running_loop()
+            vectors = await loop.run_in_executor(None, self.embeddings.embed_documents, texts)
+            vector_map: Dict[str, List[float]] = dict(zip(texts, vectors))
+
+            if len(texts) > 1:
+                logger.debug(f"查询向量批量嵌入: {len(batch)} 个请求合并为 {len(texts)} 条查询")
+
+            for text, future in batch:
+                if not future.done():
+                    future.set_result(vector_map[text])
+
+        except Exception as e:
+            logger.error(f"查询向量批量嵌入失败: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
@@ -1,13 +1,71 @@
-import jieba
+import os
 import re
+import asyncio
+import functools
+import heapq
+import operator
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from typing import List, Dict, Any, Optional
-from .vector_store import VectorStoreManager
-from .cache_manager import cache_manager
+from typing import List, Dict, Any, Optional, Callable, Set, FrozenSet
+from .vector_store import (
+    VectorStoreManager, KEYWORD_STOP_WORDS, keyword_token_set, query_word_set, query_token_set, tokenize_cached
+)
+from .cache_manager import cache_manager, MemoCache
+from .keyword_index import KeywordIndex, KeywordIndexCache
 import logging
 
+# 可选依赖：Aho-Corasick多模式匹配，一次扫描统计所有查询词的完全匹配
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+_CANDIDATE_SCORE_KEY = operator.itemgetter(0)
+_SIMILARITY_KEY = operator.itemgetter('similarity_score')
+_FINAL_SCORE_KEY = operator.itemgetter('final_score')
+
+# 重排序中内容长度偏好项（权重0.1，长度不匹配时偏好系数为0.9）
+_LENGTH_PREFERENCE_TERM = 1.0 * 0.1
+_LENGTH_PENALTY_TERM = 0.9 * 0.1
+
+# 未命中的查询词达到该数量时才用Aho-Corasick自动机统计完全匹配，否则逐词子串查找
+# （自动机逐个产出匹配位置，词少时反而比C实现的子串查找慢）
+_MIN_AUTOMATON_WORDS = 12
+
+# 混合检索中向量搜索（等待Qdrant网络响应）专用线程池，调用线程同时执行关键词检索
+_VECTOR_SEARCH_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="vector-search")
+
+# 混合检索的融合方式：weighted为归一化分数加权求和，rrf为倒数排名融合（与分数尺度无关）
+_HYBRID_FUSION = os.getenv("HYBRID_FUSION", "weighted").lower()
+_RRF_K = 60
+
+# 分数归一化改用NumPy向量化计算的最小结果数（实测约200条以下纯Python更快）
+_VECTORIZED_NORMALIZE_MIN_SIZE = 256
+
+# 构建关键词索引时不需要读取的payload字段
+_KEYWORD_INDEX_EXCLUDED_FIELDS = ["enhanced_content", "document_id"]
+
+# 查询扩展用的简单同义词表
+_QUERY_SYNONYMS = {
+    "方法": ("手段", "途径", "策略"),
+    "问题": ("难题", "困难", "挑战"),
+    "结果": ("成果", "效果", "产出"),
+    "分析": ("研究", "调查", "探讨"),
+    "系统": ("体系", "框架", "平台")
+}
+
+def _chunk_index_of(payload: Dict) -> int:
+    """分块在文档中的序号"""
+    return payload.get('chunk_index', 0)
+
+@functools.lru_cache(maxsize=8192)
+def _legacy_chunk_token_set(chunk_id: str, text: str) -> FrozenSet[str]:
+    """未预计算词集合的旧分块的分词结果，按chunk_id跨索引重建缓存（文本参与键比较，内容变化时自动失效）"""
+    return frozenset(keyword_token_set(text))
+
 class EnhancedVectorStore(VectorStoreManager):
     """增强的向量存储 - Qdrant版本"""
     
@@ -15,75 +73,74 @@ class EnhancedVectorStore(VectorStoreManager):
         super().__init__(*args, **kwargs)
         self.cache_manager = cache_manager
         
-        # 扩展停用词列表
-        self.stop_words = {
-            '的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一', '一个',
-            '这', '那', '他', '她', '它', '们', '与', '及', '以', '为', '到', '从', '被',
-            '把', '让', '使', '等', '等等', '如', '如果', '因为', '所以', '但是', '然而',
-            '而且', '或者', '并且', '也', '还', '又', '再', '更', '最', '很', '非常'
-        }
+        # 热点查询的进程内搜索结果缓存：共享缓存还存放问答和摘要，
+        # 热点搜索结果容易被挤出，在其前面单独保留一层
+        self.search_memo = MemoCache(maxsize=1024, ttl=3600)
+        
+        # 扩展停用词列表（与入库时预计算词集合使用的停用词一致）
+        self.stop_words = KEYWORD_STOP_WORDS
+        
+        # 按文档缓存的关键词倒排索引，与搜索缓存一样最长保留1小时
+        self.keyword_indexes = KeywordIndexCache(maxsize=32, ttl=3600)
     
     def search_similar_chunks_with_cache(
         self, 
         document_id: str, 
         query: str, 
-        k: int = 5
+        k: int = 5,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict]:
         """带缓存的向量搜索"""
         
         # 检查缓存
-        cache_key = self.cache_manager.search_cache_key(document_id, query, k)
-        cached_result = self.cache_manager.get(cache_key)
-        
-        if cached_result:
-            logger.info(f"命中搜索缓存: {document_id}")
+        cached_result = self._get_cached_search(document_id, query, k)
+        if cached_result is not None:
             return cached_result
         
         # 执行搜索
-        results = self.search_similar_chunks(document_id, query, k)
+        results = self.search_similar_chunks(document_id, query, k, query_embedding)
         
         # 缓存结果（1小时）
-        self.cache_manager.set(cache_key, results, expire=3600)
+        self.cache_manager.set(self.cache_manager.search_cache_key(document_id, query, k), results, expire=3600)
+        if results:
+            self.search_memo.set((document_id, query, k), results)
         
         return results
     
+    def _get_cached_search(self, document_id: str, query: str, k: int) -> Optional[List[Dict]]:
+        """依次查询进程内缓存和共享缓存，共享缓存命中时回填进程内缓存（空结果视为未命中）"""
+        memo_key = (document_id, query, k)
+        cached_result = self.search_memo.get(memo_key)
+        if cached_result is not None:
+            return cached_result
+        
+        cached_result = self.cache_manager.get(self.cache_manager.search_cache_key(document_id, query, k))
+        if cached_result:
+            logger.info(f"命中搜索缓存: {document_id}")
+            self.search_memo.set(memo_key, cached_result)
+            return cached_result
+        
+        return None
+    
     def add_document_chunks_enhanced(self, document_id: str, chunks: List[Dict]) -> bool:
         """增强的文档块添加"""
         try:
             collection_name = f"doc_{document_id}"
             
-            # 增强文本内容用于向量化
-            enhanced_texts = []
-            for chunk in chunks:
-                enhanced_text = self._enhance_text_for_embedding(chunk)
-                enhanced_texts.append(enhanced_text)
-                
-            # 生成嵌入向量
-            logger.info(f"正在为 {len(enhanced_texts)} 个增强文档块生成嵌入向量...")
-            embeddings = self.embeddings.embed_documents(enhanced_texts)
-            
-            # 准备向量点数据
-            points = []
-            for i, chunk in enumerate(chunks):
-                point = {
-                    'id': chunk["chunk_id"],
-                    'vector': embeddings[i],
-                    'payload': {
-                    "chunk_id": chunk["chunk_id"],
-                    "chunk_index": chunk["chunk_index"],
-                    "document_id": document_id,
-                        "content": chunk["content"],  # 保存原始内容
-                        "enhanced_content": enhanced_texts[i],  # 保存增强内容
-                    "chunk_length": chunk["chunk_length"],
-                    "keywords": chunk.get("keywords", []),
-                    "summary": chunk.get("summary", ""),
-                        "quality_score": chunk.get("quality_score", 0.5)
-                    }
-                }
-                points.append(point)
+            # 增强文本内容用于向量化，生成嵌入向量并准备向量点数据（按批流水线执行）
+            logger.info(f"正在为 {len(chunks)} 个增强文档块生成嵌入向量...")
+            points = self._embed_chunk_points(
+                document_id, chunks,
+                embed_text=self._enhance_text_for_embedding,
+                extra_payload=lambda chunk, text: {"enhanced_content": text}  # 保存增强内容
+            )
             
             # 添加到Qdrant
-            return self.qdrant_client.add_points(collection_name, points)
+            self.invalidate_document_caches(document_id)
+            added = self.qdrant_client.add_points(collection_name, points)
+            if added:
+                self._on_points_added(document_id, points)
+            return added
             
         except Exception as e:
             logger.error(f"增强文档块添加失败: {str(e)}")
@@ -116,29 +173,44 @@ class EnhancedVectorStore(VectorStoreManager):
         document_id: str, 
         query: str, 
         k: int = 5,
-        alpha: float = 0.7
+        alpha: float = 0.7,
+        query_embedding: Optional[List[float]] = None,
+        keyword_results: Optional[List[Dict]] = None,
+        expanded_query: Optional[str] = None
     ) -> List[Dict]:
-        """混合检索：向量搜索 + 关键词搜索"""
+        """混合检索：向量搜索 + 关键词搜索（query_embedding为扩展查询的向量，keyword_results为关键词检索结果，
+        expanded_query为扩展后的查询，均可预先计算）"""
         
         try:
             # 查询预处理和扩展
-            expanded_query = self._expand_query(query)
+            if expanded_query is None:
+                expanded_query = self._expand_query(query)
+            
+            # 向量搜索（使用扩展查询）：未命中缓存时在后台线程等待Qdrant响应
+            vector_results = self._get_cached_search(document_id, expanded_query, k * 2)
+            vector_future = None
+            if vector_results is None:
+                vector_future = _VECTOR_SEARCH_POOL.submit(
+                    self.search_similar_chunks_with_cache, document_id, expanded_query, k * 2, query_embedding
+                )
             
-            # 向量搜索（使用扩展查询）
-            vector_results = self.search_similar_chunks_with_cache(
-                document_id, expanded_query, k * 2
-            )
+            # 关键词搜索（使用原始查询，与向量搜索并行）
+            if keyword_results is None:
+                keyword_results = self._enhanced_keyword_search(document_id, query, k * 2)
+            
+            if vector_future is not None:
+                vector_results = vector_future.result()
             
-            # 关键词搜索（使用原始查询）
-            keyword_results = self._enhanced_keyword_search(document_id, query, k * 2)
+            if not vector_results and not keyword_results:
+                return []
             
-            # 融合搜索结果
+            # 融合搜索结果（重排序会重新打分选出前k个，融合阶段无需排序）
             combined_results = self._combine_search_results(
-                vector_results, keyword_results, alpha
+                vector_results, keyword_results, alpha, sort=False
             )
             
-            # 重排序优化
-            reranked_results = self._rerank_results(combined_results, query)
+            # 重排序优化（只需前k个）
+            reranked_results = self._rerank_results(combined_results, query, k)
             
             return reranked_results[:k]
             
@@ -147,25 +219,42 @@ class EnhancedVectorStore(VectorStoreManager):
             # 降级到普通向量搜索
             return self.search_similar_chunks_with_cache(document_id, query, k)
     
+    async def ahybrid_search(
+        self, 
+        document_id: str, 
+        query: str, 
+        k: int = 5,
+        alpha: float = 0.7
+    ) -> List[Dict]:
+        """异步混合检索（扩展查询与并发请求合并嵌入，检索在线程池中执行）"""
+        expanded_query = self._expand_query(query)
+        loop = asyncio.get_running_loop()
+        
+        # 关键词检索（CPU）在线程池中执行，与查询嵌入（网络IO）并行
+        keyword_future = loop.run_in_executor(
+            None, self._enhanced_keyword_search, document_id, query, k * 2
+        )
+        
+        # 搜索缓存命中时无需嵌入查询
+        query_embedding = None
+        if self._get_cached_search(document_id, expanded_query, k * 2) is None:
+            query_embedding = await self.aembed_query(expanded_query)
+        
+        keyword_results = await keyword_future
+        return await loop.run_in_executor(
+            None,
+            functools.partial(
+                self.hybrid_search, document_id, query, k, alpha, query_embedding, keyword_results, expanded_query
+            )
+        )
+    
     def _expand_query(self, query: str) -> str:
-        """查询扩展"""
+        """查询扩展（复用缓存的查询分词，逐词查同义词表）"""
         try:
-            # 提取查询关键词
-            query_keywords = jieba.analyse.extract_tags(query, topK=5)
-            
-            # 简单的同义词扩展
-            synonyms_map = {
-                "方法": ["手段", "途径", "策略"],
-                "问题": ["难题", "困难", "挑战"],
-                "结果": ["成果", "效果", "产出"],
-                "分析": ["研究", "调查", "探讨"],
-                "系统": ["体系", "框架", "平台"]
-            }
-            
             expanded_terms = [query]
-            for keyword in query_keywords:
-                if keyword in synonyms_map:
-                    expanded_terms.extend(synonyms_map[keyword])
+            # 同一词在查询中多次出现时只扩展一次
+            for token in dict.fromkeys(tokenize_cached(query)):
+                expanded_terms.extend(_QUERY_SYNONYMS.get(token, ()))
             
             return " ".join(expanded_terms)
             
@@ -173,67 +262,180 @@ class EnhancedVectorStore(VectorStoreManager):
             logger.warning(f"查询扩展失败: {e}")
             return query
     
+    def add_document_chunks(self, document_id: str, chunks: List[Dict]) -> bool:
+        """添加文档块到向量存储（同时丢弃该文档已缓存的关键词索引和搜索结果）"""
+        self.invalidate_document_caches(document_id)
+        return super().add_document_chunks(document_id, chunks)
+    
+    def delete_document_collection(self, document_id: str) -> bool:
+        """删除文档的向量集合（同时丢弃该文档已缓存的关键词索引和搜索结果）"""
+        self.invalidate_document_caches(document_id)
+        return super().delete_document_collection(document_id)
+    
+    def invalidate_document_caches(self, document_id: str):
+        """丢弃文档的关键词索引和进程内搜索结果（文档重新入库或删除时调用）"""
+        self.keyword_indexes.invalidate(document_id)
+        self.search_memo.invalidate_where(lambda key: key[0] == document_id)
+    
+    def _on_points_added(self, document_id: str, points: List[Dict]):
+        """入库成功后直接用本次写入的payload构建关键词索引，首次检索无需遍历集合；
+        集合中还有其他点（如重复处理留下的旧分块）时不预先构建，检索时再遍历集合完整构建"""
+        # 写入期间的检索可能缓存了旧分块的结果，写入完成后再丢弃一次
+        self.invalidate_document_caches(document_id)
+        if self.qdrant_client.count_points(f"doc_{document_id}") != len(points):
+            return
+        
+        payloads = [
+            {key: value for key, value in point['payload'].items() if key not in _KEYWORD_INDEX_EXCLUDED_FIELDS}
+            for point in points
+        ]
+        self.keyword_indexes.set(document_id, self._build_keyword_index(document_id, payloads))
+    
+    def _get_keyword_index(self, document_id: str) -> Optional[KeywordIndex]:
+        """获取文档的关键词倒排索引，未缓存时遍历集合构建"""
+        index = self.keyword_indexes.get(document_id)
+        if index is not None:
+            return index
+        
+        # 增强内容只用于向量化，关键词检索用不到，不随索引常驻内存
+        points = self.qdrant_client.scroll_points(
+            f"doc_{document_id}", exclude_fields=_KEYWORD_INDEX_EXCLUDED_FIELDS
+        )
+        if not points:
+            return None
+        
+        index = self._build_keyword_index(document_id, [point['payload'] for point in points])
+        self.keyword_indexes.set(document_id, index)
+        return index
+    
+    def _build_keyword_index(self, document_id: str, payloads: List[Dict]) -> KeywordIndex:
+        """由分块payload构建倒排索引（payload按分块顺序排列，得分相同时靠前的分块优先）"""
+        payloads = sorted(payloads, key=_chunk_index_of)
+        postings: Dict[str, Dict[str, List[int]]] = {'content': {}, 'summary': {}, 'keywords': {}}
+        for i, payload in enumerate(payloads):
+            # 小写内容只在构建索引时计算一次，供完全匹配检查复用
+            payload['content_lower'] = payload.get('content', '').lower()
+            payload['summary_lower'] = payload.get('summary', '').lower()
+            
+            # 词列表只用于建立倒排，建好后从常驻payload中移除，只保留词数用于计算Jaccard并集大小；
+            # 入库早于词集合预计算的文档在此补算（按chunk_id缓存，索引过期重建时无需重新分词）
+            chunk_id = payload.get('chunk_id', '')
+            content_tokens = payload.pop('token_set', None)
+            if content_tokens is None:
+                content_tokens = _legacy_chunk_token_set(chunk_id, payload.get('content', ''))
+            summary_tokens = payload.pop('summary_token_set', None)
+            if summary_tokens is None:
+                summary_tokens = _legacy_chunk_token_set(chunk_id, payload.get('summary', ''))
+            payload['token_count'] = len(content_tokens)
+            payload['summary_token_count'] = len(summary_tokens)
+            
+            # 内容词、摘要词、关键词都可能产生非零分数，按字段分别建立倒排
+            for field, terms in (
+                ('content', content_tokens),
+                ('summary', summary_tokens),
+                ('keywords', set(payload.get('keywords', [])))
+            ):
+                field_postings = postings[field]
+                for term in terms:
+                    field_postings.setdefault(term, []).append(i)
+        
+        index = KeywordIndex(payloads, postings)
+        logger.info(f"关键词倒排索引构建完成: {document_id}, {len(payloads)} 个分块, {len(postings['content'])} 个内容词")
+        return index
+    
     def _enhanced_keyword_search(self, document_id: str, query: str, k: int) -> List[Dict]:
-        """增强的关键词搜索"""
+        """增强的关键词搜索（通过倒排索引只对包含查询词的分块打分）"""
         try:
-            collection_name = f"doc_{document_id}"
-            
-            # 获取所有点
-            all_results = self.qdrant_client.search(
-                collection_name=collection_name,
-                query_vector=[0.0] * 1536,  # 虚拟向量
-                limit=1000,  # 获取大量结果用于关键词匹配
-                with_payload=True
-            )
-            
-            if not all_results:
+            index = self._get_keyword_index(document_id)
+            if index is None:
                 return []
             
-            results = []
-            for result in all_results:
-                payload = result['payload']
-                content = payload.get('content', '')
-                
-                # 计算关键词匹配分数
-                score = self._calculate_enhanced_keyword_score(content, query, payload)
-                
-                if score > 0:
-                    results.append({
-                        "content": content,
-                        "chunk_id": payload.get("chunk_id", ""),
-                        "chunk_index": payload.get("chunk_index", 0),
-                        "similarity_score": score,
-                        "metadata": {
-                            "keywords": payload.get("keywords", []),
-                            "summary": payload.get("summary", ""),
-                            "quality_score": payload.get("quality_score", 0.5),
-                            "chunk_length": payload.get("chunk_length", 0)
-                        }
-                    })
-            
-            results.sort(key=lambda x: x['similarity_score'], reverse=True)
-            return results[:k]
+            # 查询的词集合按查询缓存，各分块复用（重复查询无需重新构建）
+            query_words = query_word_set(query)
+            query_tokens = query_token_set(query)
+            count_exact_matches = self._build_exact_match_counter(query_tokens)
+            
+            def scored_candidates():
+                # 倒排表同时给出各字段命中的查询词，打分时无需再与分块词集合求交
+                for payload, hits in index.matches(query_words):
+                    # 计算关键词匹配分数
+                    score = self._calculate_enhanced_keyword_score(
+                        payload.get('content', ''), query, payload, query_words, query_tokens, count_exact_matches, hits
+                    )
+                    if score > 0:
+                        yield score, payload
+            
+            # 只保留前k个候选（有界堆），结果字典只为最终返回的分块构造
+            top_candidates = heapq.nlargest(k, scored_candidates(), key=_CANDIDATE_SCORE_KEY)
+            
+            return [
+                {
+                    "content": payload.get('content', ''),
+                    "chunk_id": payload.get("chunk_id", ""),
+                    "chunk_index": payload.get("chunk_index", 0),
+                    "similarity_score": score,
+                    "metadata": {
+                        "keywords": payload.get("keywords", []),
+                        "summary": payload.get("summary", ""),
+                        "quality_score": payload.get("quality_score", 0.5),
+                        "chunk_length": payload.get("chunk_length", 0)
+                    }
+                }
+                for score, payload in top_candidates
+            ]
             
         except Exception as e:
             logger.error(f"增强关键词搜索失败: {e}")
             return []
     
-    def _calculate_enhanced_keyword_score(self, content: str, query: str, metadata: Dict) -> float:
-        """计算增强的关键词匹配分数"""
+    def _calculate_enhanced_keyword_score(
+        self,
+        content: str,
+        query: str,
+        metadata: Dict,
+        query_words: Optional[set] = None,
+        query_tokens: Optional[set] = None,
+        count_exact_matches: Optional[Callable[[str], int]] = None,
+        hits: Optional[Dict[str, Set[str]]] = None
+    ) -> float:
+        """计算增强的关键词匹配分数（query_words为查询的原始分词，query_tokens为去停用词后的词集合，可预先计算；
+        hits为倒排索引给出的各字段命中词，提供时直接使用，不再与分块词集合求交）"""
         try:
-            # 基础关键词匹配分数
-            base_score = self._calculate_keyword_score(content, query)
+            if query_words is None:
+                query_words = query_word_set(query)
+            if query_tokens is None:
+                query_tokens = {w for w in query_words if len(w) > 1 and w not in self.stop_words}
+            
+            if hits is None:
+                content_hits = summary_hits = None
+            else:
+                content_hits = hits.get('content', set())
+                summary_hits = hits.get('summary', set())
+            
+            # 基础关键词匹配分数（优先使用倒排命中词或入库时预计算的词集合）
+            base_score = self._calculate_keyword_score(
+                content, query, query_tokens, metadata.get('token_set'),
+                metadata.get('content_lower'), count_exact_matches,
+                content_hits, metadata.get('token_count')
+            )
             
             # 关键词匹配奖励
             keywords = metadata.get('keywords', [])
-            query_words = set(jieba.cut(query.lower()))
-            keyword_matches = len(set(keywords) & query_words)
+            if hits is None:
+                # 查询词集合直接与关键词列表求交，无需先把关键词转换为集合
+                keyword_matches = len(query_words.intersection(keywords))
+            else:
+                keyword_matches = len(hits.get('keywords', ()))
             keyword_bonus = keyword_matches / max(len(keywords), 1) * 0.3
             
             # 摘要匹配奖励
             summary = metadata.get('summary', '')
             if summary:
-                summary_score = self._calculate_keyword_score(summary, query)
+                summary_score = self._calculate_keyword_score(
+                    summary, query, query_tokens, metadata.get('summary_token_set'),
+                    metadata.get('summary_lower'), count_exact_matches,
+                    summary_hits, metadata.get('summary_token_count')
+                )
                 summary_bonus = summary_score * 0.2
             else:
                 summary_bonus = 0
@@ -251,31 +453,58 @@ class EnhancedVectorStore(VectorStoreManager):
             logger.error(f"增强关键词分数计算失败: {e}")
             return 0.0
     
-    def _calculate_keyword_score(self, content: str, query: str) -> float:
-        """计算关键词匹配分数"""
+    def _calculate_keyword_score(
+        self,
+        content: str,
+        query: str,
+        query_words: Optional[set] = None,
+        content_words: Optional[List[str]] = None,
+        content_lower: Optional[str] = None,
+        count_exact_matches: Optional[Callable[[str], int]] = None,
+        matched_words: Optional[Set[str]] = None,
+        content_word_count: Optional[int] = None
+    ) -> float:
+        """计算关键词匹配分数（query_words/content_words为已去停用词的词集合，未提供时现场分词；
+        count_exact_matches为按查询预先构建的完全匹配计数器；
+        matched_words/content_word_count为倒排索引给出的命中词和内容词数，提供时无需内容词集合）"""
         try:
-            # 分词
-            query_words = set(jieba.cut(query.lower()))
-            content_words = set(jieba.cut(content.lower()))
-            
-            # 移除停用词和单字符
-            query_words = {w for w in query_words if len(w) > 1 and w not in self.stop_words}
-            content_words = {w for w in content_words if len(w) > 1 and w not in self.stop_words}
+            # 分词，移除停用词和单字符
+            if query_words is None:
+                query_words = query_token_set(query)
             
             if not query_words:
                 return 0.0
             
-            # 计算交集
-            intersection = query_words & content_words
+            if matched_words is not None and content_word_count is not None:
+                intersection = matched_words
+            else:
+                if content_words is None:
+                    content_words = keyword_token_set(content)
+                
+                # 计算交集（预计算的词列表本身无重复，直接参与求交，无需先转换为集合）
+                intersection = query_words.intersection(content_words)
+                content_word_count = len(content_words)
             
             if not intersection:
                 return 0.0
             
-            # 计算Jaccard相似度
-            jaccard_score = len(intersection) / len(query_words | content_words)
+            # 计算Jaccard相似度（并集大小由容斥得出，不构造并集）
+            jaccard_score = len(intersection) / (len(query_words) + content_word_count - len(intersection))
             
-            # 完全匹配奖励
-            exact_matches = sum(1 for word in query_words if word in content.lower())
+            # 完全匹配奖励：交集中的词由内容分词得到，必然出现在内容中，只需检查其余查询词；
+            # 查询词全部命中时无需扫描内容，剩余词较少时逐词子串查找比自动机扫描更快
+            remaining_words = len(query_words) - len(intersection)
+            if remaining_words == 0:
+                exact_matches = len(intersection)
+            else:
+                if content_lower is None:
+                    content_lower = content.lower()
+                if count_exact_matches is not None and remaining_words >= _MIN_AUTOMATON_WORDS:
+                    exact_matches = count_exact_matches(content_lower)
+                else:
+                    exact_matches = len(intersection) + sum(
+                        1 for word in query_words if word not in intersection and word in content_lower
+                    )
             exact_match_bonus = exact_matches / len(query_words) * 0.5
             
             # 查询覆盖度奖励
@@ -289,112 +518,186 @@ class EnhancedVectorStore(VectorStoreManager):
             logger.error(f"关键词分数计算失败: {e}")
             return 0.0
     
+    def _build_exact_match_counter(self, query_tokens: set) -> Optional[Callable[[str], int]]:
+        """按查询构建多模式匹配器，一次线性扫描统计出现在文本中的不同查询词数量；
+        未安装pyahocorasick或查询词较少（逐词查找更快）时返回None，由调用方逐词查找"""
+        if not AHOCORASICK_AVAILABLE or len(query_tokens) <= _MIN_AUTOMATON_WORDS:
+            return None
+        
+        automaton = ahocorasick.Automaton()
+        for word in query_tokens:
+            automaton.add_word(word, word)
+        automaton.make_automaton()
+        return lambda text: len({word for _, word in automaton.iter(text)})
+    
+    @staticmethod
+    def _minmax_normalized_scores(results: List[Dict]) -> List[float]:
+        """最小-最大归一化相似度分数（只返回分数列表，不修改传入的结果，向量搜索结果可能来自缓存）"""
+        if not results:
+            return []
+        
+        if len(results) >= _VECTORIZED_NORMALIZE_MIN_SIZE:
+            # 结果较多时用NumPy一次完成归一化，列表很短时数组转换的开销反而更大
+            scores = np.fromiter((r['similarity_score'] for r in results), dtype=np.float64, count=len(results))
+            min_score = scores.min()
+            score_range = scores.max() - min_score
+            if score_range == 0:
+                return [1.0] * len(results)
+            return ((scores - min_score) / score_range).tolist()
+        
+        scores = [r['similarity_score'] for r in results]
+        max_score = max(scores)
+        min_score = min(scores)
+        
+        if max_score == min_score:
+            return [1.0] * len(scores)
+        
+        score_range = max_score - min_score
+        return [(score - min_score) / score_range for score in scores]
+    
+    def _rrf_combine(self, vector_results: List[Dict], keyword_results: List[Dict], alpha: float) -> List[Dict]:
+        """倒数排名融合：每路结果按名次累加 权重 * (K+1)/(K+名次)，各路第一名得满分，
+        融合分数落在[0, 1]，与加权融合同一尺度，重排序权重无需调整"""
+        result_map = {}
+        for results, weight, score_field in (
+            (vector_results, alpha, 'vector_score'),
+            (keyword_results, 1 - alpha, 'keyword_score')
+        ):
+            for rank, result in enumerate(results, 1):
+                rank_score = (_RRF_K + 1) / (_RRF_K + rank)
+                key = result.get('chunk_id') or result['content']
+                merged = result_map.get(key)
+                if merged is None:
+                    merged = result_map[key] = {
+                        **result,
+                        'vector_score': 0.0,
+                        'keyword_score': 0.0,
+                        'similarity_score': 0.0
+                    }
+                merged[score_field] = rank_score
+                merged['similarity_score'] += weight * rank_score
+        
+        return list(result_map.values())
+    
+    def _single_source_results(
+        self,
+        vector_results: List[Dict],
+        keyword_results: List[Dict],
+        alpha: float
+    ) -> List[Dict]:
+        """只有一路检索有结果时的融合（无需按分块合并，分数与完整融合流程一致）"""
+        if vector_results:
+            results, weight, score_field = vector_results, alpha, 'vector_score'
+        else:
+            results, weight, score_field = keyword_results, 1 - alpha, 'keyword_score'
+        
+        return [
+            {
+                **result,
+                'vector_score': 0.0,
+                'keyword_score': 0.0,
+                score_field: score,
+                'similarity_score': weight * score
+            }
+            for result, score in zip(results, self._minmax_normalized_scores(results))
+        ]
+    
     def _combine_search_results(
         self, 
         vector_results: List[Dict], 
         keyword_results: List[Dict], 
-        alpha: float = 0.7
+        alpha: float = 0.7,
+        sort: bool = True
     ) -> List[Dict]:
-        """融合搜索结果"""
+        """融合搜索结果（sort为False时按融合顺序返回，由调用方自行排序）"""
+        if _HYBRID_FUSION == "rrf":
+            final_results = self._rrf_combine(vector_results, keyword_results, alpha)
+            if sort:
+                final_results.sort(key=_SIMILARITY_KEY, reverse=True)
+            return final_results
         
-        def normalize_scores(results):
-            if not results:
-                return results
-            
-            scores = [r['similarity_score'] for r in results]
-            max_score = max(scores) if scores else 1.0
-            min_score = min(scores) if scores else 0.0
-            
-            if max_score == min_score:
-                for r in results:
-                    r['similarity_score'] = 1.0
-                return results
-            
-            for r in results:
-                r['similarity_score'] = (r['similarity_score'] - min_score) / (max_score - min_score)
-            
-            return results
-        
-        # 归一化分数
-        vector_results = normalize_scores(vector_results.copy())
-        keyword_results = normalize_scores(keyword_results.copy())
+        if not vector_results or not keyword_results:
+            final_results = self._single_source_results(vector_results, keyword_results, alpha)
+            if sort:
+                final_results.sort(key=_SIMILARITY_KEY, reverse=True)
+            return final_results
         
-        # 创建内容映射
-        content_map = {}
+        # 按分块ID合并两路结果（短ID哈希和比较开销固定；缺少ID的旧数据退回按内容合并）
+        result_map = {}
         
         # 添加向量搜索结果
-        for result in vector_results:
-            content = result['content']
-            content_map[content] = {
+        for result, score in zip(vector_results, self._minmax_normalized_scores(vector_results)):
+            result_map[result.get('chunk_id') or result['content']] = {
                 **result,
-                'vector_score': result['similarity_score'],
+                'vector_score': score,
                 'keyword_score': 0.0
             }
         
         # 添加关键词搜索结果
-        for result in keyword_results:
-            content = result['content']
-            if content in content_map:
-                content_map[content]['keyword_score'] = result['similarity_score']
+        for result, score in zip(keyword_results, self._minmax_normalized_scores(keyword_results)):
+            key = result.get('chunk_id') or result['content']
+            merged = result_map.get(key)
+            if merged is not None:
+                merged['keyword_score'] = score
             else:
-                content_map[content] = {
+                result_map[key] = {
                     **result,
                     'vector_score': 0.0,
-                    'keyword_score': result['similarity_score']
+                    'keyword_score': score
                 }
         
         # 计算综合分数
-        for content, result in content_map.items():
-            combined_score = (
-                alpha * result['vector_score'] + 
-                (1 - alpha) * result['keyword_score']
-            )
-            result['similarity_score'] = combined_score
+        final_results = list(result_map.values())
+        keyword_weight = 1 - alpha
+        for result in final_results:
+            result['similarity_score'] = alpha * result['vector_score'] + keyword_weight * result['keyword_score']
         
         # 排序并返回
-        final_results = list(content_map.values())
-        final_results.sort(key=lambda x: x['similarity_score'], reverse=True)
+        if sort:
+            final_results.sort(key=_SIMILARITY_KEY, reverse=True)
         
         return final_results
     
-    def _rerank_results(self, results: List[Dict], query: str) -> List[Dict]:
-        """重排序结果"""
+    def _rerank_results(self, results: List[Dict], query: str, k: Optional[int] = None) -> List[Dict]:
+        """重排序结果（指定k时用有界堆只选出前k个）"""
         try:
             if not results:
                 return results
             
+            # 长查询偏好长内容，短查询偏好短内容：查询长度与结果无关，分支只判断一次
+            query_length = len(query)
+            min_content_length, max_content_length = 0, float('inf')
+            if query_length < 20:  # 短查询
+                max_content_length = 1000
+            elif query_length > 50:  # 长查询
+                min_content_length = 200
+            
             for result in results:
                 # 获取质量分数加权
                 quality_score = result.get('metadata', {}).get('quality_score', 0.5)
                 
-                # 基于查询长度的相关性调整
                 content_length = len(result['content'])
-                query_length = len(query)
-                
-                # 长查询偏好长内容，短查询偏好短内容
-                length_preference = 1.0
-                if query_length < 20:  # 短查询
-                    if content_length > 1000:
-                        length_preference = 0.9
-                elif query_length > 50:  # 长查询
-                    if content_length < 200:
-                        length_preference = 0.9
+                if min_content_length <= content_length <= max_content_length:
+                    length_term = _LENGTH_PREFERENCE_TERM
+                else:
+                    length_term = _LENGTH_PENALTY_TERM
                 
                 # 调整最终分数
-                adjusted_score = (
-                    result['similarity_score'] * 0.7 +
-                    quality_score * 0.2 +
-                    length_preference * 0.1
-                )
+                adjusted_score = result['similarity_score'] * 0.7 + quality_score * 0.2 + length_term
                 
                 result['final_score'] = adjusted_score
                 result['similarity_score'] = adjusted_score
             
             # 重新排序
-            results.sort(key=lambda x: x['final_score'], reverse=True)
+            if k is not None:
+                return heapq.nlargest(k, results, key=_FINAL_SCORE_KEY)
             
+            results.sort(key=_FINAL_SCORE_KEY, reverse=True)
             return results
             
         except Exception as e:
             logger.warning(f"结果重排序失败: {e}")
-            return results
\ No newline at end of file
+            # 降级为按融合分数排序
+            if k is not None:
+                return heapq.nlargest(k, results, key=_SIMILARITY_KEY)
+            return sorted(results, key=_SIMILARITY_KEY, reverse=True)
\ No newline at end of file
@@ -0,0 +1,66 @@
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+class KeywordIndex:
+    """单个文档的关键词倒排索引 - 按字段（内容/摘要/关键词）记录 词 -> 分块序号列表；
+    分块payload常驻内存用于打分，分块自身不再保存词列表，查询词与分块词的交集直接由倒排表得出"""
+
+    def __init__(self, payloads: List[Dict], postings: Dict[str, Dict[str, List[int]]]):
+        self.payloads = payloads
+        self.postings = postings
+        self.built_at = time.monotonic()
+
+    def candidates(self, terms: Iterable[str]) -> List[Dict]:
+        """返回至少包含一个查询词的分块payload（按入库顺序）"""
+        return [payload for payload, _ in self.matches(terms)]
+
+    def matches(self, terms: Iterable[str]) -> List[Tuple[Dict, Dict[str, Set[str]]]]:
+        """返回至少包含一个查询词的分块payload及其各字段命中的查询词（按入库顺序）"""
+        terms = set(terms)
+        hits: Dict[int, Dict[str, Set[str]]] = {}
+        for field, field_postings in self.postings.items():
+            for term in terms:
+                for i in field_postings.get(term, ()):
+                    hits.setdefault(i, {}).setdefault(field, set()).add(term)
+        return [(self.payloads[i], hits[i]) for i in sorted(hits)]
+
+class KeywordIndexCache:
+    """按文档缓存关键词倒排索引（LRU淘汰 + 过期重建）"""
+
+    def __init__(self, maxsize: int = 32, ttl: int = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._indexes: "OrderedDict[str, KeywordIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, document_id: str) -> Optional[KeywordIndex]:
+        """获取未过期的索引"""
+        with self._lock:
+            index = self._indexes.get(document_id)
+            if index is None:
+                return None
+
+            if time.monotonic() - index.built_at > self.ttl:
+                del self._indexes[document_id]
+                return None
+
+            self._indexes.move_to_end(document_id)
+            return index
+
+    def set(self, document_id: str, index: KeywordIndex):
+        """缓存索引，超出容量时淘汰最久未使用的文档"""
+        with self._lock:
+            self._indexes[document_id] = index
+            self._indexes.move_to_end(document_id)
+            if len(self._indexes) > self.maxsize:
+                self._indexes.popitem(last=False)
+
+    def invalidate(self, document_id: str):
+        """文档内容变化或删除时丢弃索引"""
+        with self._lock:
+            self._indexes.pop(document_id, None)
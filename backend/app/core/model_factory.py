@@ -18,6 +18,12 @@ try:
 except ImportError:
     QWEN_AVAILABLE = False
 
+try:
+    from ..llm.tei_embeddings import TEIEmbeddings
+    TEI_AVAILABLE = True
+except ImportError:
+    TEI_AVAILABLE = False
+
 class ModelFactory:
     """模型工厂，支持多种大模型"""
     
@@ -71,6 +77,15 @@ class ModelFactory:
                 model_name=kwargs.get("model", "text-embedding-v1")
             )
         
+        elif model_type.lower() == "tei":
+            if not TEI_AVAILABLE:
+                raise ImportError("TEI嵌入依赖未安装，请安装: pip install requests")
+            
+            return TEIEmbeddings(
+                base_url=kwargs.get("base_url"),
+                model_name=kwargs.get("tei_model")
+            )
+        
         else:
             raise ValueError(f"不支持的嵌入模型类型: {model_type}")
     
@@ -90,4 +105,7 @@ class ModelFactory:
             available["llm"].append("qwen")
             available["embeddings"].append("qwen")
         
+        if TEI_AVAILABLE:
+            available["embeddings"].append("tei")
+        
         return available 
\ No newline at end of file
@@ -56,14 +56,19 @@ class QdrantAdapter:
             logger.error(f"Qdrant健康检查失败: {e}")
             return False
     
+    def collection_exists(self, collection_name: str) -> bool:
+        """检查集合是否存在"""
+        try:
+            self.client.get_collection(collection_name=collection_name)
+            return True
+        except Exception:
+            return False
+    
     def create_collection(self, collection_name: str, dimension: int = 1536) -> bool:
         """创建向量集合"""
         try:
-            # 检查集合是否已存在
-            collections = self.client.get_collections()
-            existing_names = [col.name for col in collections.collections]
-            
-            if collection_name in existing_names:
+            # 检查集合是否已存在（只查询目标集合，不列出全部集合）
+            if self.collection_exists(collection_name):
                 logger.info(f"集合已存在: {collection_name}")
                 return True
             
@@ -112,8 +117,13 @@ class QdrantAdapter:
         try:
             qdrant_points = []
             for point in points:
+                # 仅在缺少ID时才序列化整个点（含向量）生成ID，避免每个点都构造大字符串
+                point_id = point.get('id')
+                if point_id is None:
+                    point_id = hashlib.blake2b(str(point).encode(), digest_size=16).hexdigest()
+                
                 qdrant_point = PointStruct(
-                    id=point.get('id', hashlib.md5(str(point).encode()).hexdigest()),
+                    id=point_id,
                     vector=point['vector'],
                     payload=point.get('payload', {})
                 )
@@ -182,6 +192,46 @@ class QdrantAdapter:
             logger.error(f"Qdrant搜索失败: {e}")
             return []
     
+    def scroll_points(self, collection_name: str, batch_size: int = 256, with_payload: bool = True,
+                      exclude_fields: Optional[List[str]] = None) -> List[Dict]:
+        """分页遍历集合中的全部点（不返回向量，exclude_fields中的payload字段不在服务端读取和传输）"""
+        try:
+            payload_selector = with_payload
+            if with_payload and exclude_fields:
+                payload_selector = models.PayloadSelectorExclude(exclude=exclude_fields)
+            
+            points = []
+            offset = None
+            while True:
+                records, offset = self.client.scroll(
+                    collection_name=collection_name,
+                    limit=batch_size,
+                    offset=offset,
+                    with_payload=payload_selector,
+                    with_vectors=False
+                )
+                points.extend(
+                    {'id': record.id, 'payload': (record.payload or {}) if with_payload else {}}
+                    for record in records
+                )
+                if offset is None:
+                    break
+            
+            logger.info(f"Qdrant遍历完成: {len(points)} 个点")
+            return points
+            
+        except Exception as e:
+            logger.error(f"Qdrant遍历失败: {e}")
+            return []
+    
+    def count_points(self, collection_name: str) -> int:
+        """统计集合中的点数（精确计数）"""
+        try:
+            return self.client.count(collection_name=collection_name, exact=True).count
+        except Exception as e:
+            logger.error(f"Qdrant点计数失败: {e}")
+            return 0
+    
     def delete_collection(self, collection_name: str) -> bool:
         """删除向量集合"""
         try:
@@ -0,0 +1,142 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class SemanticAnswerCache:
+    """语义问答缓存 - 问题向量足够相似时直接复用已生成的回答"""
+
+    def __init__(
+        self,
+        similarity_threshold: float = None,
+        expire: int = 3600,
+        max_entries_per_document: int = 200
+    ):
+        self.similarity_threshold = similarity_threshold or float(
+            os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")
+        )
+        self.expire = expire
+        self.max_entries_per_document = max_entries_per_document
+
+        # 按文档和检索片段数划分命名空间（与问答缓存键一致，片段数不同的请求不共用回答）：
+        # (document_id, max_results) -> {"vectors": 归一化向量矩阵, "payloads": [...], "timestamps": [...]}
+        self._namespaces: Dict[Tuple[str, Optional[int]], Dict] = {}
+        self._lock = threading.Lock()
+
+        logger.info(f"语义问答缓存初始化完成，相似度阈值: {self.similarity_threshold}")
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> Optional[np.ndarray]:
+        """归一化向量，使内积等于余弦相似度"""
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        if vec.ndim != 1 or norm == 0:
+            return None
+        return vec / norm
+
+    def _evict_expired(self, namespace: Dict):
+        """移除过期条目（时间戳按插入顺序递增，只需截掉头部）"""
+        cutoff = time.time() - self.expire
+        timestamps = namespace["timestamps"]
+        expired = 0
+        while expired < len(timestamps) and timestamps[expired] < cutoff:
+            expired += 1
+
+        if expired:
+            namespace["vectors"] = namespace["vectors"][expired:]
+            namespace["payloads"] = namespace["payloads"][expired:]
+            namespace["timestamps"] = timestamps[expired:]
+
+    def get(self, document_id: str, query_vector: List[float], max_results: Optional[int] = None) -> Optional[Dict]:
+        """查找语义相似问题的缓存回答（只在相同检索片段数的回答中查找）"""
+        try:
+            vec = self._normalize(query_vector)
+            if vec is None:
+                return None
+
+            namespace_key = (document_id, max_results)
+            with self._lock:
+                namespace = self._namespaces.get(namespace_key)
+                if not namespace:
+                    return None
+
+                self._evict_expired(namespace)
+                if not namespace["payloads"]:
+                    del self._namespaces[namespace_key]
+                    return None
+
+                if namespace["vectors"].shape[1] != vec.shape[0]:
+                    return None
+
+                scores = namespace["vectors"] @ vec
+                best = int(np.argmax(scores))
+                if scores[best] < self.similarity_threshold:
+                    return None
+
+                return {**namespace["payloads"][best], "similarity": float(scores[best])}
+
+        except Exception as e:
+            logger.error(f"语义缓存查询失败: {e}")
+            return None
+
+    def put(
+        self,
+        document_id: str,
+        query_vector: List[float],
+        answer: str,
+        sources: List[Dict],
+        confidence: float = 0.0,
+        max_results: Optional[int] = None
+    ) -> bool:
+        """缓存问题向量对应的回答"""
+        try:
+            vec = self._normalize(query_vector)
+            if vec is None:
+                return False
+
+            payload = {
+                "answer": answer,
+                "sources": sources,
+                "confidence": confidence
+            }
+
+            namespace_key = (document_id, max_results)
+            with self._lock:
+                namespace = self._namespaces.get(namespace_key)
+                if namespace is None or namespace["vectors"].shape[1] != vec.shape[0]:
+                    namespace = {
+                        "vectors": np.empty((0, vec.shape[0]), dtype=np.float32),
+                        "payloads": [],
+                        "timestamps": []
+                    }
+                    self._namespaces[namespace_key] = namespace
+
+                namespace["vectors"] = np.vstack([namespace["vectors"], vec])
+                namespace["payloads"].append(payload)
+                namespace["timestamps"].append(time.time())
+
+                # 超出容量时淘汰最旧的条目
+                overflow = len(namespace["payloads"]) - self.max_entries_per_document
+                if overflow > 0:
+                    namespace["vectors"] = namespace["vectors"][overflow:]
+                    namespace["payloads"] = namespace["payloads"][overflow:]
+                    namespace["timestamps"] = namespace["timestamps"][overflow:]
+
+            return True
+
+        except Exception as e:
+            logger.error(f"语义缓存写入失败: {e}")
+            return False
+
+    def invalidate(self, document_id: str):
+        """清除指定文档的缓存（所有检索片段数的命名空间）"""
+        with self._lock:
+            for namespace_key in [key for key in self._namespaces if key[0] == document_id]:
+                del self._namespaces[namespace_key]
+
+# 全局语义问答缓存实例
+semantic_answer_cache = SemanticAnswerCache()
@@ -1,11 +1,78 @@
 import os
+import asyncio
+import functools
+import hashlib
 import logging
-from typing import List, Dict, Optional
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Set, FrozenSet, Tuple, Callable
 from .model_factory import ModelFactory
 from .qdrant_adapter import QdrantAdapter
+from .embedding_batcher import QueryEmbeddingBatcher
+from .cache_manager import MemoCache
 
 logger = logging.getLogger(__name__)
 
+# 可选：jieba_fast为jieba核心分词的C实现，接口与分词结果一致；
+# 入库和查询的分词都经过本模块，两侧始终使用同一实现，关键词匹配不受影响
+try:
+    import jieba_fast as jieba
+    JIEBA_FAST_AVAILABLE = True
+except ImportError:
+    import jieba
+    JIEBA_FAST_AVAILABLE = False
+
+# 入库时按批生成嵌入向量：嵌入请求在后台线程执行，同时在调用线程准备该批的payload
+_EMBED_BATCH_SIZE = 64
+_EMBED_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="embed")
+
+# 分块嵌入向量缓存：同一文档重新入库时无需重新调用嵌入接口。
+# 使用独立的有界缓存，不占用问答/摘要/搜索结果的共享缓存容量，也不写入其持久化日志；
+# 向量以double数组保存（约为浮点数列表内存的1/4）
+_EMBED_CACHE_TTL = 7 * 86400
+_EMBED_CACHE = MemoCache(maxsize=int(os.getenv("EMBEDDING_CACHE_SIZE", "4096")), ttl=_EMBED_CACHE_TTL)
+
+# 导入时加载jieba词典，避免首次检索时才懒加载造成的冷启动延迟
+jieba.initialize()
+
+# 关键词检索的停用词
+KEYWORD_STOP_WORDS = frozenset({
+    '的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一', '一个',
+    '这', '那', '他', '她', '它', '们', '与', '及', '以', '为', '到', '从', '被',
+    '把', '让', '使', '等', '等等', '如', '如果', '因为', '所以', '但是', '然而',
+    '而且', '或者', '并且', '也', '还', '又', '再', '更', '最', '很', '非常'
+})
+
+@functools.lru_cache(maxsize=4096)
+def tokenize_cached(text: str) -> Tuple[str, ...]:
+    """小写化后分词并缓存结果（用于查询，重复/热门查询无需重新调用jieba）"""
+    return tuple(jieba.cut(text.lower()))
+
+@functools.lru_cache(maxsize=4096)
+def query_word_set(query: str) -> FrozenSet[str]:
+    """查询的原始分词集合（含停用词和单字，用于匹配分块关键词），同样缓存"""
+    return frozenset(tokenize_cached(query))
+
+@functools.lru_cache(maxsize=4096)
+def query_token_set(query: str) -> FrozenSet[str]:
+    """查询的关键词集合（基于缓存的分词结果，过滤结果同样缓存，重复查询无需再逐词过滤）"""
+    return frozenset(w for w in tokenize_cached(query) if len(w) > 1 and w not in KEYWORD_STOP_WORDS)
+
+def keyword_token_set(text: str) -> Set[str]:
+    """分词并移除停用词和单字符，得到关键词匹配用的词集合"""
+    return {w for w in jieba.cut(text.lower()) if len(w) > 1 and w not in KEYWORD_STOP_WORDS}
+
+def _embedding_cache_key(model_id: str, text: str) -> Tuple[str, bytes]:
+    """嵌入向量缓存键：模型标识 + 文本摘要（不在缓存中保留分块原文）"""
+    return model_id, hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+def chunk_token_payload(chunk: Dict) -> Dict:
+    """入库时预先计算分块内容和摘要的词集合，关键词检索时无需对每个分块重新分词"""
+    return {
+        "token_set": list(keyword_token_set(chunk["content"])),
+        "summary_token_set": list(keyword_token_set(chunk.get("summary", "")))
+    }
+
 class VectorStoreManager:
     """向量存储管理器 - Qdrant版本"""
     
@@ -38,6 +105,12 @@ class VectorStoreManager:
             **(embedding_config or {})
         )
         
+        # 异步查询路径共用的查询向量微批处理器
+        self.query_batcher = QueryEmbeddingBatcher(self.embeddings)
+        
+        # 嵌入维度在首次创建集合时探测一次，之后复用
+        self._embedding_dimension = None
+        
         logger.info(f"Qdrant向量存储管理器初始化完成 - 服务器: {self.qdrant_host}:{self.qdrant_port}")
     
     def create_document_collection(self, document_id: str) -> bool:
@@ -45,68 +118,123 @@ class VectorStoreManager:
         try:
             collection_name = f"doc_{document_id}"
             
-            # 获取嵌入维度
-            dimension = 1536  # 默认维度
-            if hasattr(self.embeddings, 'embed_query'):
-                test_embedding = self.embeddings.embed_query("test")
-                dimension = len(test_embedding)
+            # 集合已存在（如重新处理文档）时无需探测嵌入维度
+            if self.qdrant_client.collection_exists(collection_name):
+                logger.info(f"集合已存在: {collection_name}")
+                return True
             
-            return self.qdrant_client.create_collection(collection_name, dimension)
+            return self.qdrant_client.create_collection(collection_name, self._get_embedding_dimension())
             
         except Exception as e:
             logger.error(f"创建文档集合失败: {str(e)}")
             return False
     
+    def _get_embedding_dimension(self) -> int:
+        """获取嵌入维度（首次调用时嵌入测试文本探测，结果缓存在实例上）"""
+        if self._embedding_dimension is None:
+            dimension = 1536  # 默认维度
+            if hasattr(self.embeddings, 'embed_query'):
+                test_embedding = self.embeddings.embed_query("test")
+                dimension = len(test_embedding)
+            self._embedding_dimension = dimension
+        return self._embedding_dimension
+    
     def add_document_chunks(self, document_id: str, chunks: List[Dict]) -> bool:
         """添加文档块到向量存储"""
         try:
             collection_name = f"doc_{document_id}"
             
-            # 准备文本用于嵌入
-            texts = [chunk["content"] for chunk in chunks]
-            
-            # 生成嵌入向量
-            logger.info(f"正在为 {len(texts)} 个文档块生成嵌入向量...")
-            embeddings = self.embeddings.embed_documents(texts)
-            
-            # 准备向量点数据
-            points = []
-            for i, chunk in enumerate(chunks):
-                point = {
-                    'id': chunk["chunk_id"],
-                    'vector': embeddings[i],
-                    'payload': {
-                        "chunk_id": chunk["chunk_id"],
-                        "chunk_index": chunk["chunk_index"],
-                        "document_id": document_id,
-                        "content": chunk["content"],
-                        "chunk_length": chunk["chunk_length"],
-                        "keywords": chunk.get("keywords", []),
-                        "summary": chunk.get("summary", ""),
-                        "quality_score": chunk.get("quality_score", 0.5)
-                    }
-                }
-                points.append(point)
+            # 生成嵌入向量并准备向量点数据
+            logger.info(f"正在为 {len(chunks)} 个文档块生成嵌入向量...")
+            points = self._embed_chunk_points(
+                document_id, chunks,
+                embed_text=lambda chunk: chunk["content"]
+            )
             
             # 添加到Qdrant
-            return self.qdrant_client.add_points(collection_name, points)
+            added = self.qdrant_client.add_points(collection_name, points)
+            if added:
+                self._on_points_added(document_id, points)
+            return added
             
         except Exception as e:
             logger.error(f"添加文档块失败: {str(e)}")
             return False
     
+    def _on_points_added(self, document_id: str, points: List[Dict]):
+        """文档块写入成功后的扩展点（子类可用本次写入的payload预先构建检索结构）"""
+        pass
+    
+    def _embed_chunk_points(
+        self,
+        document_id: str,
+        chunks: List[Dict],
+        embed_text: Callable[[Dict], str],
+        extra_payload: Optional[Callable[[Dict, str], Dict]] = None
+    ) -> List[Dict]:
+        """分批嵌入并构建向量点：每批的嵌入请求在后台线程等待网络响应时，
+        调用线程同时为该批构建payload（jieba分词等CPU工作），两者重叠执行；
+        按嵌入模型和文本缓存向量，只为未命中缓存的文本调用嵌入接口"""
+        model_id = f"{type(self.embeddings).__name__}:{getattr(self.embeddings, 'model_name', '')}"
+        points = []
+        cache_hits = 0
+        for start in range(0, len(chunks), _EMBED_BATCH_SIZE):
+            batch_chunks = chunks[start:start + _EMBED_BATCH_SIZE]
+            batch_texts = [embed_text(chunk) for chunk in batch_chunks]
+            
+            cache_keys = [_embedding_cache_key(model_id, text) for text in batch_texts]
+            vectors = [_EMBED_CACHE.get(key) for key in cache_keys]
+            vectors = [vector.tolist() if vector is not None else None for vector in vectors]
+            missing = [i for i, vector in enumerate(vectors) if vector is None]
+            cache_hits += len(batch_texts) - len(missing)
+            future = None
+            if missing:
+                future = _EMBED_POOL.submit(self.embeddings.embed_documents, [batch_texts[i] for i in missing])
+            
+            payloads = [
+                {
+                    "chunk_id": chunk["chunk_id"],
+                    "chunk_index": chunk["chunk_index"],
+                    "document_id": document_id,
+                    "content": chunk["content"],
+                    "chunk_length": chunk["chunk_length"],
+                    "keywords": chunk.get("keywords", []),
+                    "summary": chunk.get("summary", ""),
+                    "quality_score": chunk.get("quality_score", 0.5),
+                    **chunk_token_payload(chunk),
+                    **(extra_payload(chunk, text) if extra_payload else {})
+                }
+                for chunk, text in zip(batch_chunks, batch_texts)
+            ]
+            
+            if future is not None:
+                for i, vector in zip(missing, future.result()):
+                    vectors[i] = vector
+                    _EMBED_CACHE.set(cache_keys[i], array('d', vector))
+            
+            points.extend(
+                {'id': chunk["chunk_id"], 'vector': vector, 'payload': payload}
+                for chunk, vector, payload in zip(batch_chunks, vectors, payloads)
+            )
+        
+        if cache_hits:
+            logger.info(f"嵌入向量缓存命中 {cache_hits}/{len(chunks)} 个文档块")
+        return points
+    
     def search_similar_chunks(
         self, 
         document_id: str, 
         query: str, 
-        k: int = 5
+        k: int = 5,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict]:
-        """搜索相似文档块"""
+        """搜索相似文档块（可传入已计算的查询向量以避免重复嵌入）"""
         try:
             collection_name = f"doc_{document_id}"
             
             # 生成查询向量
-            query_embedding = self.embeddings.embed_query(query)
+            if query_embedding is None:
+                query_embedding = self.embeddings.embed_query(query)
             
             # 执行搜索
             search_results = self.qdrant_client.search(
@@ -140,6 +268,30 @@ class VectorStoreManager:
             logger.error(f"搜索相似块失败: {str(e)}")
             return []
     
+    async def asearch_similar_chunks(
+        self, 
+        document_id: str, 
+        query: str, 
+        k: int = 5,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict]:
+        """异步搜索相似文档块（查询向量与并发请求合并嵌入，搜索在线程池中执行）"""
+        if query_embedding is None:
+            query_embedding = await self.aembed_query(query)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None,
+            functools.partial(self.search_similar_chunks, document_id, query, k, query_embedding)
+        )
+    
+    async def aembed_query(self, query: str) -> Optional[List[float]]:
+        """通过微批处理器获取查询向量，失败时返回None由同步搜索自行嵌入"""
+        try:
+            return await self.query_batcher.embed_query(query)
+        except Exception as e:
+            logger.warning(f"批量查询嵌入失败，改为单独嵌入: {e}")
+            return None
+    
     def delete_document_collection(self, document_id: str) -> bool:
         """删除文档的向量集合"""
         try:
@@ -1,11 +1,20 @@
 import os
 import dashscope
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 from langchain.embeddings.base import Embeddings
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 单次嵌入请求的文本数，以及同时发出的请求数（嵌入接口为网络IO，多批并发可缩短入库耗时）
+_EMBED_REQUEST_BATCH_SIZE = 10
+_EMBED_REQUEST_CONCURRENCY = max(1, int(os.getenv("QWEN_EMBEDDING_CONCURRENCY", "4")))
+_EMBED_REQUEST_POOL = ThreadPoolExecutor(
+    max_workers=_EMBED_REQUEST_CONCURRENCY,
+    thread_name_prefix="qwen-embed"
+)
+
 class QwenEmbeddings(Embeddings):
     """通义千问嵌入模型适配器"""
     
@@ -20,14 +29,19 @@ class QwenEmbeddings(Embeddings):
         dashscope.api_key = api_key
     
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """嵌入多个文档"""
-        embeddings = []
-        
+        """嵌入多个文档（分批请求，多批时并发发出，结果按原顺序拼接）"""
         # 批量处理，避免单次请求过大
-        batch_size = 10
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i:i + batch_size]
-            batch_embeddings = self._get_embeddings(batch_texts)
+        batches = [
+            texts[i:i + _EMBED_REQUEST_BATCH_SIZE]
+            for i in range(0, len(texts), _EMBED_REQUEST_BATCH_SIZE)
+        ]
+        if len(batches) <= 1 or _EMBED_REQUEST_CONCURRENCY == 1:
+            batch_results = map(self._get_embeddings, batches)
+        else:
+            batch_results = _EMBED_REQUEST_POOL.map(self._get_embeddings, batches)
+        
+        embeddings = []
+        for batch_embeddings in batch_results:
             embeddings.extend(batch_embeddings)
         
         return embeddings
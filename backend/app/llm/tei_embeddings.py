@@ -0,0 +1,69 @@
+import os
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from langchain.embeddings.base import Embeddings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 单次请求的文本数，以及同时发出的请求数（TEI服务端会把并发请求动态合批到GPU上）
+_TEI_REQUEST_BATCH_SIZE = max(1, int(os.getenv("TEI_BATCH_SIZE", "32")))
+_TEI_REQUEST_CONCURRENCY = max(1, int(os.getenv("TEI_CONCURRENCY", "4")))
+_TEI_REQUEST_POOL = ThreadPoolExecutor(
+    max_workers=_TEI_REQUEST_CONCURRENCY,
+    thread_name_prefix="tei-embed"
+)
+
+class TEIEmbeddings(Embeddings):
+    """Text Embeddings Inference（TEI）嵌入适配器 - 调用独立部署的嵌入推理服务"""
+    
+    def __init__(self, base_url: str = None, model_name: str = None, timeout: float = 30.0):
+        self.base_url = (base_url or os.getenv("TEI_URL", "http://localhost:8080")).rstrip("/")
+        # 模型名参与嵌入缓存键，未指定时以服务地址区分
+        self.model_name = model_name or os.getenv("TEI_MODEL", self.base_url)
+        self.timeout = timeout
+        
+        # 复用HTTP连接，避免每批请求重新建立连接
+        self._session = requests.Session()
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """嵌入多个文档（分批请求，多批时并发发出，结果按原顺序拼接）"""
+        batches = [
+            texts[i:i + _TEI_REQUEST_BATCH_SIZE]
+            for i in range(0, len(texts), _TEI_REQUEST_BATCH_SIZE)
+        ]
+        if len(batches) <= 1 or _TEI_REQUEST_CONCURRENCY == 1:
+            batch_results = map(self._get_embeddings, batches)
+        else:
+            batch_results = _TEI_REQUEST_POOL.map(self._get_embeddings, batches)
+        
+        embeddings = []
+        for batch_embeddings in batch_results:
+            embeddings.extend(batch_embeddings)
+        
+        return embeddings
+    
+    def embed_query(self, text: str) -> List[float]:
+        """嵌入单个查询"""
+        embeddings = self._get_embeddings([text])
+        return embeddings[0] if embeddings else []
+    
+    def _get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """调用TEI的 /embed 接口"""
+        try:
+            response = self._session.post(
+                f"{self.base_url}/embed",
+                json={"inputs": texts, "truncate": True},
+                timeout=self.timeout
+            )
+            
+            if response.status_code == 200:
+                return response.json()
+            else:
+                logger.error(f"TEI嵌入接口调用失败: {response.status_code} {response.text[:200]}")
+                raise Exception(f"嵌入API调用失败: HTTP {response.status_code}")
+                
+        except Exception as e:
+            logger.error(f"TEI嵌入调用异常: {str(e)}")
+            raise e
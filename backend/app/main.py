@@ -4,14 +4,16 @@ os.environ["ANONYMIZED_TELEMETRY"] = "False"
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 import os
 import uuid
+import json
 import asyncio
 from datetime import datetime, timedelta
 import logging
 import time
-from typing import Set, List
+from typing import Set, List, Optional, Callable
 
 from .database import get_db, create_tables, Document, QueryHistory
 from .schemas import *
@@ -33,12 +35,40 @@ logger = logging.getLogger(__name__)
 class DocumentTaskProcessor:
     """定时任务文档处理器"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        vector_store: Optional[VectorStoreManager] = None,
+        on_document_updated: Optional[Callable[[str], None]] = None
+    ):
         self.processing: Set[str] = set()  # 正在处理的文档ID
         self.is_running = False
         self.poll_interval = 10  # 轮询间隔（秒）
         self.retry_interval = 300  # 重试间隔（5分钟）
         
+        # 处理组件在首次处理文档时创建，之后所有文档复用（避免每个文档重建嵌入模型和Qdrant客户端）；
+        # 传入查询使用的向量存储时入库与检索共用同一实例，入库后检索侧的索引和缓存随之更新
+        self._processor = None
+        self._vector_store = vector_store
+        
+        # 文档入库完成后的回调，用于丢弃该文档旧内容的问答/搜索缓存
+        self._on_document_updated = on_document_updated
+        
+    def _get_components(self):
+        """获取复用的文档处理器和向量存储"""
+        if self._processor is None:
+            self._processor = DocumentProcessor()
+        
+        if self._vector_store is None:
+            # 根据环境变量选择模型类型
+            embedding_type = os.getenv("EMBEDDING_TYPE", "qwen")
+            self._vector_store = VectorStoreManager(
+                embedding_type=embedding_type,
+                embedding_config={
+                    "model": os.getenv("QWEN_EMBEDDING_MODEL", "text-embedding-v1")
+                }
+            )
+        return self._processor, self._vector_store
+        
     async def start_polling(self):
         """启动定时轮询"""
         self.is_running = True
@@ -48,6 +78,8 @@ class DocumentTaskProcessor:
             try:
                 await self.process_pending_documents()
                 await self.process_failed_documents()  # 新增：处理失败的文档
+                # 顺带清理过期缓存（持久化日志中失效记录过多时同时压缩）
+                cache_manager.clear_expired()
                 await asyncio.sleep(self.poll_interval)
             except Exception as e:
                 logger.error(f"轮询处理失败: {e}")
@@ -148,16 +180,7 @@ class DocumentTaskProcessor:
                 return
             
             # 获取处理组件
-            processor = DocumentProcessor()
-            
-            # 根据环境变量选择模型类型
-            embedding_type = os.getenv("EMBEDDING_TYPE", "qwen")
-            vector_store = VectorStoreManager(
-                embedding_type=embedding_type,
-                embedding_config={
-                    "model": os.getenv("QWEN_EMBEDDING_MODEL", "text-embedding-v1")
-                }
-            )
+            processor, vector_store = self._get_components()
             
             # 处理文档 - 支持COS存储
             result = processor.process_document(
@@ -171,6 +194,8 @@ class DocumentTaskProcessor:
                 # 创建向量存储
                 vector_store.create_document_collection(document_id)
                 vector_store.add_document_chunks(document_id, result["chunks"])
+                if self._on_document_updated is not None:
+                    self._on_document_updated(document_id)
                 
                 # 更新数据库状态
                 document.status = "completed"
@@ -271,7 +296,10 @@ vector_store = EnhancedVectorStore(
     qdrant_https=os.getenv("QDRANT_HTTPS", "false").lower() == "true",
     qdrant_api_key=os.getenv("QDRANT_API_KEY"),
     embedding_type=os.getenv("EMBEDDING_TYPE", "qwen"),
-    embedding_config={}
+    embedding_config={
+        # 与入库使用同一嵌入模型
+        "model": os.getenv("QWEN_EMBEDDING_MODEL", "text-embedding-v1")
+    }
 )
 
 agent = DocumentAnalysisAgent(
@@ -283,8 +311,11 @@ agent = DocumentAnalysisAgent(
     }
 )
 
-# 全局处理器实例
-doc_processor = DocumentTaskProcessor()
+# 全局处理器实例（与查询共用向量存储，重新处理文档后丢弃其旧缓存）
+doc_processor = DocumentTaskProcessor(
+    vector_store=vector_store,
+    on_document_updated=agent.invalidate_document_caches
+)
 
 # 创建数据库表
 create_tables()
@@ -461,7 +492,7 @@ async def hybrid_query_document(
         raise HTTPException(status_code=400, detail=f"文档状态: {document.status}，无法查询")
     
     try:
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         # 使用混合检索
         search_results = vector_store.hybrid_search(
@@ -476,7 +507,7 @@ async def hybrid_query_document(
                 answer="抱歉，在该文档中未找到与您问题相关的内容。",
                 confidence=0.0,
                 sources=[],
-                processing_time=time.time() - start_time
+                processing_time=time.perf_counter() - start_time
             )
         
         # 使用智能体生成回答
@@ -554,6 +585,48 @@ async def query_document(
         logger.error(f"查询处理失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"查询处理失败: {str(e)}")
 
+@app.post("/api/v1/documents/{document_id}/query/stream")
+async def stream_query_document(
+    document_id: str,
+    request: QueryRequest,
+    db: Session = Depends(get_db)
+):
+    """流式查询文档内容 - 以SSE逐段返回回答，最后返回完整结果"""
+    
+    document = db.query(Document).filter(Document.id == document_id).first()
+    if not document:
+        raise HTTPException(status_code=404, detail="文档不存在")
+    
+    if document.status != "completed":
+        raise HTTPException(status_code=400, detail=f"文档状态: {document.status}，无法查询")
+    
+    async def event_stream():
+        async for event in agent.astream_answer_question(
+            document_id=document_id,
+            question=request.question,
+            max_results=request.max_results
+        ):
+            if "final" in event and event["final"]["success"]:
+                result = event["final"]
+                
+                # 保存查询历史
+                try:
+                    query_record = QueryHistory(
+                        document_id=document_id,
+                        question=request.question,
+                        answer=result["answer"],
+                        confidence=result["confidence"],
+                        processing_time=result["processing_time"]
+                    )
+                    db.add(query_record)
+                    db.commit()
+                except Exception as e:
+                    logger.error(f"保存查询历史失败: {str(e)}")
+            
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @app.get("/api/v1/documents/{document_id}", response_model=DocumentInfo)
 async def get_document_info(document_id: str, db: Session = Depends(get_db)):
     """获取文档信息"""
@@ -622,6 +695,23 @@ async def generate_document_summary(document_id: str, db: Session = Depends(get_
         logger.error(f"摘要生成失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"摘要生成失败: {str(e)}")
 
+@app.post("/api/v1/documents/{document_id}/summary/stream")
+async def stream_document_summary(document_id: str, db: Session = Depends(get_db)):
+    """流式生成文档摘要 - 以SSE逐段返回摘要，最后返回完整结果"""
+    
+    document = db.query(Document).filter(Document.id == document_id).first()
+    if not document:
+        raise HTTPException(status_code=404, detail="文档不存在")
+    
+    if document.status != "completed":
+        raise HTTPException(status_code=400, detail=f"文档状态: {document.status}，无法生成摘要")
+    
+    async def event_stream():
+        async for event in agent.astream_summary(document_id):
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @app.delete("/api/v1/documents/{document_id}")
 async def delete_document(document_id: str, db: Session = Depends(get_db)):
     """删除文档 - 支持COS和本地存储"""
@@ -644,6 +734,7 @@ async def delete_document(document_id: str, db: Session = Depends(get_db)):
         
         # 删除向量存储
         vector_store.delete_document_collection(document_id)
+        agent.invalidate_document_caches(document_id)
         
         # 删除数据库记录
         db.delete(document)
@@ -783,7 +874,7 @@ async def enhanced_query_document(
             )
         
         # 使用增强问答方法
-        result = agent.answer_question_enhanced(
+        result = await agent.answer_question_enhanced(
             document_id=document_id,
             question=request.question,
             max_results=request.max_results
@@ -819,6 +910,55 @@ async def enhanced_query_document(
         logger.error(f"增强问答处理失败: {str(e)}")
         raise HTTPException(status_code=500, detail="问答处理失败")
 
+@app.post("/api/v1/documents/{document_id}/enhanced-query/stream")
+async def stream_enhanced_query_document(
+    document_id: str,
+    request: QueryRequest,
+    db: Session = Depends(get_db)
+):
+    """流式增强问答接口 - 以SSE逐段返回回答，最后返回完整结果"""
+    
+    # 检查文档是否存在且已完成处理
+    document = db.query(Document).filter(Document.id == document_id).first()
+    if not document:
+        raise HTTPException(status_code=404, detail="文档未找到")
+    
+    if document.status != "completed":
+        raise HTTPException(
+            status_code=400, 
+            detail=f"文档处理未完成，当前状态: {document.status}"
+        )
+    
+    async def event_stream():
+        async for event in agent.astream_answer_enhanced(
+            document_id=document_id,
+            question=request.question,
+            max_results=request.max_results
+        ):
+            if "final" in event:
+                result = event["final"]
+                
+                # 保存查询历史
+                if result["success"]:
+                    try:
+                        query_history = QueryHistory(
+                            document_id=document_id,
+                            question=request.question,
+                            answer=result["answer"],
+                            confidence=result["confidence"],
+                            processing_time=result["processing_time"]
+                        )
+                        db.add(query_history)
+                        db.commit()
+                    except Exception as e:
+                        logger.error(f"保存查询历史失败: {str(e)}")
+                
+                event = {"final": {**result, "document_id": document_id}}
+            
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @app.post("/api/v1/documents/{document_id}/enhanced-summary")
 async def generate_enhanced_document_summary(document_id: str, db: Session = Depends(get_db)):
     """生成增强文档摘要"""
@@ -836,7 +976,7 @@ async def generate_enhanced_document_summary(document_id: str, db: Session = Dep
             )
         
         # 生成增强摘要
-        result = agent.generate_summary_enhanced(document_id)
+        result = await agent.generate_summary_enhanced(document_id)
         
         if not result["success"]:
             raise HTTPException(status_code=500, detail=result.get("error", "摘要生成失败"))
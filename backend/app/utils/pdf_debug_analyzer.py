@@ -1,5 +1,6 @@
 import fitz  # PyMuPDF
 import os
+import re
 import json
 import logging
 from typing import Dict, List, Any
@@ -7,6 +8,9 @@ from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# HTML标签（计算HTML提取结果的纯文本长度时移除）
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+
 class PDFDebugAnalyzer:
     """PDF内容提取调试分析器 - 专门用于排查PyMuPDF提取问题"""
     
@@ -237,8 +241,7 @@ class PDFDebugAnalyzer:
             try:
                 html_text = sample_page.get_text("html")
                 # 移除HTML标签来计算纯文本长度
-                import re
-                clean_text = re.sub(r'<[^>]+>', '', html_text)
+                clean_text = _HTML_TAG_RE.sub('', html_text)
                 methods["html"] = {
                     "method": "get_text('html')",
                     "html_length": len(html_text),